@@ -7,6 +7,14 @@
 #   python 3.6+
 #   tensorflow r1.13+
 # Extended data parser for tf-K standard IO APIs.
+# Version: 0.20 # 2026/10/19
+# Comments:
+#   1. Add `H5Statistics` into this module.
+#   2. Add the submodule `augment` for batch augmentations.
+#   3. Add `H5PGParser`, `H5Pyramid`, `H5SharedLoader`,
+#      `H5SMParser`, `H5ParallelSaver`, `H5Repacker` into this
+#      module.
+#   4. Add `register_codec` for the encoded-blob datasets.
 # Version: 0.18 # 2020/02/10
 # Comments:
 #   Add `H5Converter` into this module.
@@ -23,9 +31,10 @@
 '''
 
 # Import sub-modules
-from .h5py import H5HGParser, H5SupSaver, H5GParser, H5GCombiner, H5VGParser, H5Converter
+from . import augment
+from .h5py import H5HGParser, H5SupSaver, H5GParser, H5GCombiner, H5VGParser, H5Converter, H5Statistics, H5PGParser, H5Pyramid, H5SharedLoader, H5SMParser, H5ParallelSaver, H5Repacker, register_codec
 
-__all__ = ['H5HGParser', 'H5SupSaver', 'H5GParser', 'H5GCombiner', 'H5VGParser', 'H5Converter']
+__all__ = ['augment', 'H5HGParser', 'H5SupSaver', 'H5GParser', 'H5GCombiner', 'H5VGParser', 'H5Converter', 'H5Statistics', 'H5PGParser', 'H5Pyramid', 'H5SharedLoader', 'H5SMParser', 'H5ParallelSaver', 'H5Repacker', 'register_codec']
 
 # Set this local module as the prefered one
 from pkgutil import extend_path
@@ -0,0 +1,273 @@
+'''
+################################################################
+# Data - augment
+# @ Modern Deep Network Toolkits for Tensorflow-Keras
+# Yuchen Jin @ cainmagi@gmail.com
+# Requirements: (Pay attention to version)
+#   python 3.6+
+#   tensorflow r1.13+
+# Vectorized data augmentation for batches. Each transform
+# accepts the batches produced by a parser (one array for each
+# keyword), and processes the whole batch by numpy without per-
+# sample loops. So the transforms could be used as the
+# `preprocfunc` of H5GParser directly, e.g.
+#   preprocfunc=Compose(RandomCrop((64, 64)), RandomFlip((1,)),
+#                       GaussianNoise(0.1, keys=(0,)), seed=1)
+# Version: 0.10 # 2026/10/19
+# Comments:
+#   Create this submodule.
+################################################################
+'''
+
+import threading
+import numpy as np
+
+class BatchTransform:
+    '''Base class of the batch transforms
+    A transform is applied to the batches (one array for each keyword)
+    selected by `keys`, and the other batches would be returned unchanged.
+    The random parameters are shared by all selected batches, so the
+    input and the label would be transformed in the same way.
+    Each call would use a random state seeded by (seed, key), where the key
+    identifies the batch, e.g.
+        transform(x, y, key=(epoch, idx))
+    so the same batch would get the same augmentation in any calling order
+    (e.g. with the worker threads of Keras). If the key is not given, the
+    call number would be used instead, and the results are reproducible
+    only when the calls are sequential.
+    '''
+    def __init__(self, keys=None, seed=None):
+        '''
+        Arguments:
+            keys: the positions of the batches that need to be transformed.
+                  If not set, transform all batches.
+            seed: the random seed. If not set, the results would not be
+                  reproducible.
+        '''
+        self.keys = None if keys is None else tuple(keys)
+        self.reseed(seed)
+
+    def reseed(self, seed=None):
+        '''
+        Reset the random seed and the call number.
+        '''
+        self.seed = seed
+        self.__count = 0
+        self.__lock = threading.Lock()
+
+    def _random_state(self, key=None):
+        '''
+        Get the random state of the batch identified by `key` (an int or a
+        tuple of ints). If the key is not given, use the call number.
+        '''
+        if key is None:
+            with self.__lock:
+                key = self.__count
+                self.__count += 1
+        if self.seed is None:
+            return np.random.RandomState()
+        key = np.atleast_1d(np.asarray(key, dtype=np.int64)).ravel()
+        return np.random.RandomState([self.seed % (2**32), *(key % (2**32)).tolist()])
+
+    def __call__(self, *batches, key=None):
+        rng = self._random_state(key)
+        keys = range(len(batches)) if self.keys is None else self.keys
+        res = list(batches)
+        params = self.params(rng, [res[k] for k in keys])
+        for k in keys:
+            res[k] = self.apply(res[k], params)
+        return tuple(res)
+
+    def params(self, rng, batches):
+        '''
+        Draw the random parameters for the selected batches. Should be
+        implemented by the subclasses.
+        '''
+        return None
+
+    def apply(self, batch, params):
+        '''
+        Apply the transform to one batch with the drawn parameters. Should
+        be implemented by the subclasses.
+        '''
+        raise NotImplementedError
+
+class Compose:
+    '''Compose multiple batch transforms
+    The transforms would be applied in order. If `seed` is specified,
+    the seeds of the transforms would be reset by it. The batch key is
+    passed to each transform (see BatchTransform).
+    '''
+    def __init__(self, *transforms, seed=None):
+        self.transforms = transforms
+        if seed is not None:
+            for i, t in enumerate(self.transforms):
+                t.reseed(seed + i)
+
+    def __call__(self, *batches, key=None):
+        for t in self.transforms:
+            batches = t(*batches) if key is None else t(*batches, key=key)
+        return batches
+
+class RandomCrop(BatchTransform):
+    '''Random cropping
+    Crop a random window from each sample. The windows are read from
+    a strided view of the batch by fancy indexing, so all samples are
+    cropped by one indexing operation. The selected batches should share
+    the same sizes along the cropped axes.
+    '''
+    def __init__(self, size, axes=None, keys=None, seed=None):
+        '''
+        Arguments:
+            size: the window size along each cropped axis.
+            axes: the cropped axes (the sample axis is 0). If not set, use
+                  (1, 2, ..., len(size)).
+        '''
+        super(RandomCrop, self).__init__(keys=keys, seed=seed)
+        self.size = tuple(size)
+        self.axes = tuple(range(1, len(self.size) + 1)) if axes is None else tuple(axes)
+        if len(self.axes) != len(self.size) or 0 in self.axes:
+            raise ValueError('The cropped axes should be not the sample axis, and correspond to the window size.')
+
+    def params(self, rng, batches):
+        shape = batches[0].shape
+        origins = []
+        for a, s in zip(self.axes, self.size):
+            if shape[a] < s:
+                raise ValueError('The window size {0} is larger than the axis size {1}.'.format(s, shape[a]))
+            origins.append(rng.randint(0, shape[a] - s + 1, size=shape[0]))
+        return origins
+
+    def apply(self, batch, params):
+        shape = list(batch.shape)
+        strides = list(batch.strides)
+        axes = [a % batch.ndim for a in self.axes]
+        wshape, wstrides = [shape[0]], [strides[0]]
+        for a, s in zip(axes, self.size):
+            wshape.append(shape[a] - s + 1)
+            wstrides.append(strides[a])
+            shape[a] = s
+        view = np.lib.stride_tricks.as_strided(batch, shape=wshape + shape[1:], strides=wstrides + strides[1:], writeable=False)
+        return view[(np.arange(shape[0]), *params)]
+
+class RandomFlip(BatchTransform):
+    '''Random flipping
+    Flip each sample along each axis with a probability. The flipping
+    is selected by per-sample masks.
+    '''
+    def __init__(self, axes=(1,), prob=0.5, keys=None, seed=None):
+        '''
+        Arguments:
+            axes: the flipped axes (the sample axis is 0).
+            prob: the probability of flipping each axis.
+        '''
+        super(RandomFlip, self).__init__(keys=keys, seed=seed)
+        self.axes = tuple(axes)
+        self.prob = prob
+
+    def params(self, rng, batches):
+        return rng.uniform(size=(len(self.axes), len(batches[0]))) < self.prob
+
+    def apply(self, batch, params):
+        for a, mask in zip(self.axes, params):
+            mask = np.reshape(mask, (-1,) + (1,) * (batch.ndim - 1))
+            batch = np.where(mask, np.flip(batch, axis=a), batch)
+        return batch
+
+def _instance_moments(batch, axis, epsilon):
+    '''
+    Get the instance mean and std. like InstanceGaussianNoise.
+    '''
+    reduction_axes = list(range(batch.ndim))
+    if axis is not None:
+        del reduction_axes[axis]
+    del reduction_axes[0]
+    mean = np.mean(batch, axis=tuple(reduction_axes), keepdims=True)
+    stddev = np.std(batch, axis=tuple(reduction_axes), keepdims=True) + epsilon
+    return mean, stddev
+
+class GaussianNoise(BatchTransform):
+    '''Gaussian noise
+    With the 'add' mode, the noise is added in the instance normalized
+    space like InstanceGaussianNoise:
+        `output = std * ( (input-mean) / std + N(0, eps) ) + mean`.
+    where `eps ~ U(0, alpha)` is drawn for each sample. With the 'mul'
+    mode, the input is multiplied by the noise like GaussianDropout:
+        `output = input * N(1, alpha / (1 - alpha))`.
+    '''
+    def __init__(self, alpha=0.3, mode='add', axis=None, epsilon=1e-3, keys=None, seed=None):
+        '''
+        Arguments:
+            alpha:   the maximal std. of the noise ('add'), or the drop rate
+                     ('mul').
+            mode:    'add' or 'mul'.
+            axis:    the axis that should be normalized in the 'add' mode
+                     (typically the channel axis). If not set, normalize all
+                     values of each sample.
+            epsilon: small float added to std. to avoid dividing by zero.
+        '''
+        super(GaussianNoise, self).__init__(keys=keys, seed=seed)
+        if mode not in ('add', 'mul'):
+            raise ValueError('The noise mode should be \'add\' or \'mul\'.')
+        if axis == 0:
+            raise ValueError('Axis cannot be zero')
+        self.alpha = alpha
+        self.mode = mode
+        self.axis = axis
+        self.epsilon = epsilon
+
+    def params(self, rng, batches):
+        if self.mode == 'add':
+            eps = rng.uniform(0.0, self.alpha, size=len(batches[0]))
+        else:
+            eps = None
+        return rng, eps
+
+    def apply(self, batch, params):
+        rng, eps = params
+        batch = np.asarray(batch, dtype=np.float32) if batch.dtype.kind != 'f' else batch
+        if self.mode == 'add':
+            _, stddev = _instance_moments(batch, self.axis, self.epsilon)
+            eps = np.reshape(eps, (-1,) + (1,) * (batch.ndim - 1))
+            return batch + (stddev * eps * rng.standard_normal(size=batch.shape)).astype(batch.dtype)
+        else:
+            stddev = np.sqrt(self.alpha / (1.0 - self.alpha))
+            return batch * rng.normal(1.0, stddev, size=batch.shape).astype(batch.dtype)
+
+class IntensityJitter(BatchTransform):
+    '''Intensity jitter
+    Apply a random gain and a random offset to each sample:
+        `output = (1 + U(-scale, scale)) * input + U(-shift, shift) * std`
+    where std is the instance std. (like InstanceGaussianNoise), so the
+    offset is scale-invariant.
+    '''
+    def __init__(self, scale=0.1, shift=0.1, axis=None, epsilon=1e-3, keys=None, seed=None):
+        '''
+        Arguments:
+            scale:   the maximal relative change of the gain.
+            shift:   the maximal offset relative to the instance std.
+            axis:    if set, draw the gain and the offset for each channel
+                     along this axis, and compute std. per channel.
+            epsilon: small float added to std.
+        '''
+        super(IntensityJitter, self).__init__(keys=keys, seed=seed)
+        if axis == 0:
+            raise ValueError('Axis cannot be zero')
+        self.scale = scale
+        self.shift = shift
+        self.axis = axis
+        self.epsilon = epsilon
+
+    def params(self, rng, batches):
+        shape = [len(batches[0])] + [1] * (batches[0].ndim - 1)
+        if self.axis is not None:
+            shape[self.axis] = batches[0].shape[self.axis]
+        gain = 1.0 + rng.uniform(-self.scale, self.scale, size=shape)
+        offset = rng.uniform(-self.shift, self.shift, size=shape)
+        return gain, offset
+
+    def apply(self, batch, params):
+        gain, offset = params
+        batch = np.asarray(batch, dtype=np.float32) if batch.dtype.kind != 'f' else batch
+        _, stddev = _instance_moments(batch, self.axis, self.epsilon)
+        return (gain * batch + offset * stddev).astype(batch.dtype)
@@ -10,6 +10,44 @@
 # Warning:
 #   The standard tf dataset is proved to be incompatible with 
 #   tf-K architecture. We need to wait until tf fix the bug.
+# Version: 0.40 # 2026/10/19
+# Comments:
+#   1. Add `H5Statistics` for computing the per-channel stat-
+#      istics of a file in a streaming way, and enable
+#      `H5GParser` to normalize batches by such statistics.
+#   2. Let `H5HGParser` cache the dataset handles and read
+#      each batch by grouped selections.
+#   3. Provide `aiter()` for iterating the batches of parsers
+#      in asyncio services.
+#   4. Enable `H5GParser` to cache the decoded samples in a
+#      local folder during the first epoch.
+#   5. Provide the 'feistel' permutation mode for the parsers,
+#      which computes the shuffled indices with O(1) memory.
+#   6. Support the SWMR mode in `H5SupSaver` and `H5GParser`
+#      for reading the data while it is being dumped.
+#   7. Enable `H5SupSaver` to store quantized datasets, and let
+#      `H5GParser` dequantize them on the fly.
+#   8. Enable `H5GParser` to memoize the outputs of a determin-
+#      istic pre-processing function in a local folder.
+#   9. Add `H5PGParser` for sampling random patches from large
+#      samples by reading the hyperslabs only.
+#   10. Add `H5Pyramid` for building the resolution pyramids,
+#       and let `H5GParser` read a chosen level.
+#   11. Add `H5SharedLoader` and `H5SMParser` for sharing one
+#       copy of the data among multiple processes.
+#   12. Enable `H5GParser` to preload the datasets into the
+#       memory, with or without compression.
+#   13. Add `H5ParallelSaver` for writing shards by multiple
+#       processes and merging them by virtual datasets.
+#   14. Add the sharded TFRecord format for `H5Converter`.
+#   15. Support the channel/region selections in `H5GParser`.
+#   16. Make the batch indexing of the force_epoch mode stateless.
+#   17. Add the metadata index written by `H5SupSaver`.
+#   18. Add `H5Repacker`, and the access statistics of `H5GParser`.
+#   19. Share the file handles and the chunk caches between parsers.
+#   20. Support the encoded-blob datasets with the registered codecs.
+#   21. Support the bit-packed and run-length encoded binary masks.
+#   22. Support the sparse (CSR) datasets.
 # Version: 0.30 # 2020/08/30
 # Comments:
 #   1. Enable `H5VGParser` and `H5GParser` to force the sample
@@ -55,6 +93,41 @@ import numpy as np
 import tensorflow as tf
 import os
 import io
+import json
+import zlib
+import hashlib
+import functools
+import pickle
+import types
+import asyncio
+import multiprocessing
+import multiprocessing.pool
+import threading
+
+from tensorflow.python.platform import tf_logging as logging
+
+# pylint: disable=g-import-not-at-top
+try:
+    from multiprocessing import shared_memory
+except ImportError:
+    shared_memory = None
+try:
+    import lz4.frame as lz4frame
+except ImportError:
+    lz4frame = None
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+def _h5_process_pool(processes, initializer=None, initargs=()):
+    '''
+    Create a process pool by the spawn context. Forking a process which has
+    initialized tensorflow (or opened h5py files) may deadlock or crash, so
+    the workers should be started as fresh interpreters. The state set at
+    runtime (e.g. the registered codecs) should be restored by `initializer`.
+    '''
+    return multiprocessing.get_context('spawn').Pool(processes, initializer=initializer, initargs=initargs)
 
 class H52TXT:
     '''An example of converter between HDF5 and TXT'''
@@ -105,11 +178,224 @@ class H52BIN:
             else:
                 h5data[:].ravel().astype(np.float32).tofile(f)
 
+def _h5_index_name(fileName):
+    '''
+    The path of the metadata index of a file.
+    '''
+    return fileName + '.index.json'
+
+def _h5_collect_index(f):
+    '''
+    Collect the metadata (name, shape, dtype, chunks) of all datasets in
+    an opened file.
+    '''
+    datasets = []
+    def collect(name, obj):
+        if isinstance(obj, h5py.Dataset):
+            datasets.append([name, list(obj.shape), obj.dtype.str, list(obj.chunks) if obj.chunks is not None else None])
+    f.visititems(collect)
+    return datasets
+
+def _h5_write_index(fileName, datasets):
+    '''
+    Write the metadata index of a closed file. The index is validated by
+    the size and the modification time of the file.
+    '''
+    stat = os.stat(fileName)
+    index = {
+        'source_size': stat.st_size,
+        'source_mtime': stat.st_mtime_ns,
+        'datasets': datasets
+    }
+    with open(_h5_index_name(fileName), 'w') as f:
+        json.dump(index, f)
+
+def _h5_read_index(fileName):
+    '''
+    Read the metadata index of a file. Return None if the index does not
+    exist or does not match the file.
+    '''
+    path = _h5_index_name(fileName)
+    if not os.path.isfile(path):
+        return None
+    try:
+        with open(path, 'r') as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        return None
+    stat = os.stat(fileName)
+    if index.get('source_size', None) != stat.st_size or index.get('source_mtime', None) != stat.st_mtime_ns:
+        logging.warning('The metadata index {0} is out of date, and would be ignored.'.format(path))
+        return None
+    return index['datasets']
+
+class _H5LazyDatasets:
+    '''Dataset handles opened on demand
+    Used with the metadata index, so that opening a parser does not need
+    to open all datasets.
+    '''
+    def __init__(self, f, names):
+        self.f = f
+        self.names = names
+        self.__dsets = dict()
+
+    def __len__(self):
+        return len(self.names)
+
+    def __getitem__(self, i):
+        dset = self.__dsets.get(i, None)
+        if dset is None:
+            dset = self.__dsets[i] = _H5_FILE_POOL.dataset(self.f, self.names[i])
+        return dset
+
+def _h5_tfrecord_write(args):
+    '''
+    The worker of H52TFRecord. Convert a range of samples into a TFRecord
+    shard.
+    '''
+    fileName, keywords, start, stop, shardName, chunkSize = args
+    with h5py.File(fileName, 'r') as f, tf.io.TFRecordWriter(shardName) as writer:
+        dsets = [f[key] for key in keywords]
+        for s in range(start, stop, chunkSize):
+            e = min(s + chunkSize, stop)
+            chunks = [dset[s:e] for dset in dsets]
+            for i in range(e - s):
+                feature = {'index': tf.train.Feature(int64_list=tf.train.Int64List(value=[s + i]))}
+                for key, chunk in zip(keywords, chunks):
+                    feature[key] = tf.train.Feature(bytes_list=tf.train.BytesList(value=[np.ascontiguousarray(chunk[i]).tobytes()]))
+                writer.write(tf.train.Example(features=tf.train.Features(feature=feature)).SerializeToString())
+    return stop - start
+
+def _h5_tfrecord_read(args):
+    '''
+    The worker of H52TFRecord. Convert a TFRecord shard into a temporary
+    HDF5 shard.
+    '''
+    shardName, h5Name, schema, chunkSize = args
+    tf_record_iterator = tf.compat.v1.io.tf_record_iterator
+    saver = H5SupSaver(h5Name)
+    try:
+        buffers = {key: [] for key in schema['keywords']}
+        def flush():
+            for key, info in zip(schema['keywords'], schema['datasets']):
+                if buffers[key]:
+                    data = np.stack([np.frombuffer(b, dtype=info['dtype']).reshape(info['shape']) for b in buffers[key]], axis=0)
+                    saver.dump(key, data, dtype=np.dtype(info['dtype']), chunks=True)
+                    buffers[key] = []
+        for record in tf_record_iterator(shardName):
+            example = tf.train.Example.FromString(record)
+            for key in schema['keywords']:
+                buffers[key].append(example.features.feature[key].bytes_list.value[0])
+            if len(buffers[schema['keywords'][0]]) >= chunkSize:
+                flush()
+        flush()
+    finally:
+        saver.close()
+    return h5Name
+
+def _h5_copy_chunks(dst, src, offset=0, chunkSize=None):
+    '''
+    Copy the dataset `src` into `dst[offset:offset+len(src)]` chunk by chunk.
+    '''
+    step = chunkSize if chunkSize is not None else (src.chunks[0] if src.chunks is not None else max(len(src), 1))
+    for s in range(0, len(src), step):
+        e = min(s + step, len(src))
+        dst[offset+s:offset+e] = src[s:e]
+
+class H52TFRecord:
+    '''Converter between HDF5 and sharded TFRecord files
+    Different from the other converters, this converter works with the
+    whole file, because each TFRecord example contains a sample of all
+    keywords. The samples are split into several shards in order, and
+    each keyword is stored as the raw bytes of the sample, together with
+    an int64 feature "index". A sidecar file `schema.json` records the
+    keywords, types, sample shapes and the shard list, so the records
+    could be parsed by tf.data, e.g.
+        tf.reshape(tf.io.decode_raw(features[key], dtype), shape)
+    Both directions are streamed chunk by chunk, and the shards are
+    processed by a (spawned) process pool in parallel.
+    '''
+    def __init__(self, shards=8, keywords=None, workers=None, chunkSize=256):
+        '''
+        Arguments:
+            shards:    the number of TFRecord shards (for h52other).
+            keywords:  the converted keywords. If not set, use all datasets
+                       in the root of the file (for h52other).
+            workers:   the number of worker processes. If not set, use the
+                       number of shards.
+            chunkSize: the number of samples read/written in each step.
+        '''
+        self.shards = int(shards)
+        self.keywords = (keywords,) if isinstance(keywords, str) else keywords
+        self.workers = workers
+        self.chunkSize = int(chunkSize)
+
+    def h52other(self, f, folder):
+        '''
+        Convert the opened HDF5 file `f` into the TFRecord shards in `folder`.
+        '''
+        keywords = self.keywords
+        if keywords is None:
+            index = _h5_read_index(f.filename)
+            if index is not None:
+                keywords = [d[0] for d in index if '/' not in d[0]]
+            else:
+                keywords = [k for k in f.keys() if isinstance(f[k], h5py.Dataset)]
+        size = len(f[keywords[0]])
+        for key in keywords:
+            if len(f[key]) != size:
+                raise TypeError('The assigned keywords do not correspond to each other.')
+        os.makedirs(folder, exist_ok=True)
+        bounds = np.linspace(0, size, self.shards + 1).astype(np.int64)
+        shardNames = ['data-{0:05d}-of-{1:05d}.tfrecord'.format(i, self.shards) for i in range(self.shards)]
+        schema = {
+            'keywords': list(keywords),
+            'datasets': [{'dtype': f[key].dtype.str, 'shape': list(f[key].shape[1:])} for key in keywords],
+            'shards': shardNames,
+            'sizes': np.diff(bounds).tolist()
+        }
+        tasks = [(f.filename, keywords, int(bounds[i]), int(bounds[i+1]), os.path.join(folder, shardNames[i]), self.chunkSize) for i in range(self.shards)]
+        with _h5_process_pool(self.workers if self.workers is not None else self.shards) as pool:
+            for name, num in zip(shardNames, pool.imap(_h5_tfrecord_write, tasks)):
+                print('Have dumped {0} samples into {1}'.format(num, name))
+        with open(os.path.join(folder, 'schema.json'), 'w') as fs:
+            json.dump(schema, fs)
+
+    def other2h5(self, folder, f):
+        '''
+        Convert the TFRecord shards in `folder` into the opened HDF5 file `f`.
+        '''
+        with open(os.path.join(folder, 'schema.json'), 'r') as fs:
+            schema = json.load(fs)
+        tmpNames = [os.path.join(folder, '{0}.tmp.h5'.format(name)) for name in schema['shards']]
+        tasks = [(os.path.join(folder, name), tmp, schema, self.chunkSize) for name, tmp in zip(schema['shards'], tmpNames)]
+        try:
+            with _h5_process_pool(self.workers if self.workers is not None else len(tasks)) as pool:
+                pool.map(_h5_tfrecord_read, tasks)
+            total = int(np.sum(schema['sizes']))
+            for key, info in zip(schema['keywords'], schema['datasets']):
+                shape = tuple(info['shape'])
+                ds = f.create_dataset(key, shape=(total, *shape), maxshape=(None, *shape), dtype=np.dtype(info['dtype']), chunks=True)
+                N = 0
+                for tmp in tmpNames:
+                    with h5py.File(tmp, 'r') as ft:
+                        if key in ft:
+                            _h5_copy_chunks(ds, ft[key], N, self.chunkSize)
+                            N += len(ft[key])
+                print('Have dumped {0}'.format(key))
+        finally:
+            for tmp in tmpNames:
+                if os.path.isfile(tmp):
+                    os.remove(tmp)
+
 class H5Converter:
     '''Conversion between HDF5 data and other formats.
     The "other formats" would be arranged in to form of several
     folders and files. Each data group would be mapped into a
     folder, and each dataset would be mapped into a file.
+    If the HDF5 file has a valid metadata index (written by
+    H5SupSaver), the datasets would be found from the index
+    instead of walking through the file.
     '''
     def __init__(self, fileName, oformat, toOther=True):
         '''
@@ -122,7 +408,9 @@ class H5Converter:
             oformat:  the format function for a single dataset,
                       it could be provided by users, or use the
                       default configurations. (avaliable: 'txt',
-                      'bin'.)
+                      'bin', 'tfrecord'.) A format working with the
+                      whole file (like H52TFRecord) should provide
+                      the methods h52other and other2h5.
             toOther:  the flag for conversion mode. If set True,
                       the mode would be h52other, i.e. an HDF5
                       set would be converted into other formats.
@@ -153,8 +441,12 @@ class H5Converter:
             self.__func = H52TXT()
         elif oformat == 'bin':
             self.__func = H52BIN()
+        elif oformat == 'tfrecord':
+            self.__func = H52TFRecord()
         else:
-            if self.__read:
+            if hasattr(oformat, 'h52other') and hasattr(oformat, 'other2h5'):
+                pass
+            elif self.__read:
                 if not hasattr(oformat, 'write'):
                     raise AttributeError('The "oformat" should contains the write method for applying the conversion.')
             else:
@@ -179,9 +471,20 @@ class H5Converter:
         print('Have dumped {0}'.format(g.name))
 
     def __h52other(self):
-        self.__h5iterate(self.f, self.__savefunc)
+        if hasattr(self.__func, 'h52other'):
+            self.__func.h52other(self.f, self.folder)
+            return
+        index = _h5_read_index(self.f.filename)
+        if index is not None:
+            for d in index:
+                self.__savefunc(self.f[d[0]])
+        else:
+            self.__h5iterate(self.f, self.__savefunc)
     
     def __other2h5(self):
+        if hasattr(self.__func, 'other2h5'):
+            self.__func.other2h5(self.folder, self.f)
+            return
         for root, _, files in os.walk(self.folder, topdown=False):
             for name in files:
                 dsetName = '/'+ os.path.relpath(os.path.join(root, os.path.splitext(name)[0]), start=self.folder).replace('\\', '/')
@@ -194,13 +497,133 @@ class H5Converter:
         else:
             self.__h52other()
 
+def _h5_quant_params(data, qtype, axis=None):
+    '''
+    Get the (scale, offset) for quantizing the data into the type `qtype`,
+    i.e. `data = stored * scale + offset`.
+    '''
+    if qtype not in (np.dtype(np.uint8), np.dtype(np.uint16), np.dtype(np.float16)):
+        raise TypeError('The quantized type should be uint8, uint16 or float16, but given {0}.'.format(qtype))
+    if axis is None:
+        reduction_axes = None
+    else:
+        reduction_axes = tuple(i for i in range(data.ndim) if i != axis % data.ndim)
+    if qtype.kind == 'f':
+        shape = () if axis is None else (data.shape[axis],)
+        return np.ones(shape, dtype=np.float32), np.zeros(shape, dtype=np.float32)
+    vmin = np.amin(data, axis=reduction_axes).astype(np.float32)
+    vmax = np.amax(data, axis=reduction_axes).astype(np.float32)
+    scale = (vmax - vmin) / np.float32(np.iinfo(qtype).max)
+    scale = np.where(scale > 0, scale, 1.0).astype(np.float32)
+    return scale, vmin
+
+def _h5_quantize(data, qtype, scale, offset, axis=None):
+    '''
+    Quantize the data into the type `qtype` by (scale, offset).
+    '''
+    qtype = np.dtype(qtype)
+    if axis is not None:
+        bshape = [1] * data.ndim
+        bshape[axis] = -1
+        scale, offset = np.reshape(scale, bshape), np.reshape(offset, bshape)
+    data = (np.asarray(data, dtype=np.float32) - offset) / scale
+    if qtype.kind == 'f':
+        return data.astype(qtype)
+    return np.clip(np.rint(data), 0, np.iinfo(qtype).max).astype(qtype)
+
+def _h5_npy_encode(sample):
+    buf = io.BytesIO()
+    np.save(buf, np.ascontiguousarray(sample), allow_pickle=False)
+    return buf.getvalue()
+
+def _h5_npy_decode(blob):
+    return np.load(io.BytesIO(blob), allow_pickle=False)
+
+def _h5_zlib_encode(sample):
+    return zlib.compress(_h5_npy_encode(sample))
+
+def _h5_zlib_decode(blob):
+    return _h5_npy_decode(zlib.decompress(blob))
+
+def _h5_lz4_encode(sample):
+    return lz4frame.compress(_h5_npy_encode(sample))
+
+def _h5_lz4_decode(blob):
+    return _h5_npy_decode(lz4frame.decompress(blob))
+
+def _h5_rle_encode(sample):
+    '''
+    Run-length encode a binary mask. The blob contains the number of axes,
+    the shape, the first value, and the run lengths (uint32).
+    '''
+    flat = np.ravel(np.asarray(sample) > 0.5)
+    bounds = np.concatenate([[0], np.flatnonzero(flat[1:] != flat[:-1]) + 1, [len(flat)]])
+    header = np.array([np.ndim(sample), *np.shape(sample), int(flat[0]) if len(flat) > 0 else 0], dtype=np.int64)
+    return header.tobytes() + np.diff(bounds).astype(np.uint32).tobytes()
+
+def _h5_rle_decode(blob):
+    ndim = int(np.frombuffer(blob, dtype=np.int64, count=1)[0])
+    header = np.frombuffer(blob, dtype=np.int64, count=ndim + 2)
+    runs = np.frombuffer(blob, dtype=np.uint32, offset=(ndim + 2) * 8)
+    values = (np.arange(len(runs)) + header[-1]) % 2 == 1
+    return np.repeat(values, runs).reshape(header[1:-1])
+
+_H5_CODECS = {
+    'raw': (_h5_npy_encode, _h5_npy_decode),
+    'zlib': (_h5_zlib_encode, _h5_zlib_decode),
+    'rle': (_h5_rle_encode, _h5_rle_decode)
+}
+if lz4frame is not None:
+    _H5_CODECS['lz4'] = (_h5_lz4_encode, _h5_lz4_decode)
+
+def register_codec(name, encoder, decoder):
+    '''
+    Register a codec for the encoded-blob datasets (see
+    H5SupSaver.dump_encoded). The default codecs are 'raw' (the .npy
+    format), 'zlib' (the .npy format compressed by zlib), 'rle' (the run-
+    length encoding of binary masks, decoded as bool) and 'lz4' (if lz4 is
+    installed).
+    Arguments:
+        name:    the codec name stored with the dataset.
+        encoder: a function mapping a sample (numpy array) to bytes.
+        decoder: a function mapping the bytes to a sample.
+    The decoders may be called by the decoding workers of H5GParser. In
+    the process mode, the codecs are sent to the spawned workers, so the
+    functions should be picklable (i.e. defined in a module). In the thread
+    mode, the decoders should be thread-safe.
+    '''
+    _H5_CODECS[name] = (encoder, decoder)
+
+def _h5_get_codec(name):
+    codec = _H5_CODECS.get(name, None)
+    if codec is None:
+        raise KeyError('The codec "{0}" is not registered, need to call register_codec() first.'.format(name))
+    return codec
+
+def _h5_decode_init(codecs):
+    '''
+    Register the codecs in a spawned decoding process, which only has the
+    default codecs after importing this module.
+    '''
+    _H5_CODECS.update(codecs)
+
+def _h5_decode_blobs(args):
+    '''
+    Decode a list of blobs into a batch. Used by the decoding workers.
+    '''
+    name, blobs = args
+    decoder = _h5_get_codec(name)[1]
+    if len(blobs) == 0:
+        return None
+    return np.stack([decoder(np.asarray(blob, dtype=np.uint8).tobytes()) for blob in blobs], axis=0)
+
 class H5SupSaver:
     '''Save supervised data set as .h5 file
     This class allows users to dump multiple datasets into one file
     handle, then it would save it as a .h5 file. The keywords of the
     sets should be assigned by users.
     '''
-    def __init__(self, fileName, enableRead=False):
+    def __init__(self, fileName, enableRead=False, swmr=False, index=False):
         '''
         Create the .h5 file while initialization.
         Arguments:
@@ -208,11 +631,21 @@ class H5SupSaver:
             enableRead: when set True, enable the read/write mode.
                         This option is used when adding data to an
                         existed file.
+            swmr:       when set True, open the file with the latest
+                        format so that the single-writer/multiple-reader
+                        (SWMR) mode could be started by start_swmr().
+            index:      when set True, write a metadata index (names,
+                        shapes, types and chunks of all datasets) as the
+                        sidecar file `<fileName>.index.json` when closing
+                        the file. The parsers and the converter would use
+                        the index to open the file without walking through
+                        it. The index is validated by the size and the
+                        modification time of the file.
         '''
         self.f = None
         self.logver = 0
         self.__kwargs = dict()
-        self.open(fileName, enableRead)
+        self.open(fileName, enableRead, swmr, index)
         self.config(dtype='f')
         
     def config(self, **kwargs):
@@ -236,65 +669,1983 @@ class H5SupSaver:
         if self.logver > 0:
             print('Current configuration is:', self.__kwargs)
     
-    def dump(self, keyword, data, **kwargs):
+    def dump(self, keyword, data, quantize=None, quantizeAxis=None, packbits=False, **kwargs):
         '''
         Dump the dataset with a keyword into the file.
         Arguments:
             keyword: the keyword of the dumped dataset.
             data:    dataset, should be a numpy array.
+            quantize: the quantized storage type ('uint8', 'uint16' or
+                      'float16'). If set, the data would be mapped into the
+                      range of the type linearly, and the scale and offset
+                      would be stored as the attributes `quant_scale` and
+                      `quant_offset`. The H5GParser would dequantize the
+                      data into float32.
+            quantizeAxis: if set, compute the scale and offset for each
+                          channel along this axis (the sample axis is 0).
+            packbits: if on, the data would be stored as a binary mask (the
+                      values > 0.5 are 1), packed into bits along the last
+                      axis. The length of the last axis would be stored as
+                      the attribute `packbits_length`. The H5GParser would
+                      unpack the data.
         Providing more configurations for `create_dataset` would override
         the default configuration defined by self.config()
         If the provided `keyword` exists, the dataset would be resized for
-        accepting more data.
+        accepting more data. If the existed dataset is quantized, the data
+        would be quantized by the stored scale and offset (values out of
+        the range would be clipped). Specifying `quantize` for an existed
+        dataset that is not quantized by the same type would raise an error.
+        '''
+        if self.f is None:
+            raise OSError('Should not dump data before opening a file.')
+        newkw = self.__kwargs.copy()
+        newkw.update(kwargs)
+        if keyword in self.f and 'packbits_length' in self.f[keyword].attrs:
+            if data.shape[-1] != self.f[keyword].attrs['packbits_length']:
+                raise ValueError('The last axis of the data should be {0}, but given {1}.'.format(self.f[keyword].attrs['packbits_length'], data.shape[-1]))
+            packbits = True
+        if packbits:
+            if quantize is not None:
+                raise ValueError('The data could not be both quantized and packed into bits.')
+            packLength = data.shape[-1]
+            data = np.packbits(np.asarray(data) > 0.5, axis=-1)
+            newkw['dtype'] = np.uint8
+        dshape = data.shape[1:]
+        if keyword in self.f:
+            ds = self.f[keyword]
+            dsshape = ds.shape[1:]
+            if np.all(np.array(dshape, dtype=np.int) == np.array(dsshape, dtype=np.int)):
+                N = len(ds)
+                newN = data.shape[0]
+                if quantize is not None and ('quant_scale' not in ds.attrs or ds.dtype != np.dtype(quantize)):
+                    raise ValueError('The existed dataset "{0}" is not quantized as {1}, so the data could not be appended with quantization.'.format(keyword, quantize))
+                if 'quant_scale' in ds.attrs:
+                    data = _h5_quantize(data, ds.dtype, ds.attrs['quant_scale'], ds.attrs['quant_offset'], ds.attrs.get('quant_axis', None))
+                ds.resize(N+newN, axis=0)
+                ds[N:N+newN, ...] = data
+                if self.f.swmr_mode:
+                    ds.flush()
+                if self.logver > 0:
+                    print('Dump {smp} data samples into the existed dataset {ds}. The data shape is {sze} now.'.format(smp=newN, ds=keyword, sze=ds.shape))
+            else:
+                raise ValueError('The data set shape {0} does not match the input shape {1}.'.format(dsshape, dshape))
+        else:
+            if self.f.swmr_mode:
+                raise KeyError('Could not create the new dataset "{0}" in the SWMR mode. All datasets should be created before calling start_swmr().'.format(keyword))
+            if quantize is not None:
+                qtype = np.dtype(quantize)
+                scale, offset = _h5_quant_params(data, qtype, quantizeAxis)
+                newkw['dtype'] = qtype
+                ds = self.f.create_dataset(keyword, data=_h5_quantize(data, qtype, scale, offset, quantizeAxis), maxshape=(None, *dshape), **newkw)
+                ds.attrs['quant_scale'] = scale
+                ds.attrs['quant_offset'] = offset
+                if quantizeAxis is not None:
+                    ds.attrs['quant_axis'] = quantizeAxis % data.ndim
+            else:
+                ds = self.f.create_dataset(keyword, data=data, maxshape=(None, *dshape), **newkw)
+                if packbits:
+                    ds.attrs['packbits_length'] = packLength
+            if self.logver > 0:
+                print('Dump {0} into the file. The data shape is {1}.'.format(keyword, data.shape))
+
+    def dump_encoded(self, keyword, data, codec='zlib', **kwargs):
+        '''
+        Dump the samples as the encoded byte blobs (one variable-length
+        uint8 array for each sample). The codec name would be stored as
+        the attribute `codec`, and the H5GParser would decode the batches.
+        It is useful when the encoded samples (e.g. compressed images) are
+        much smaller than the decoded ones.
+        Arguments:
+            keyword: the keyword of the dumped dataset.
+            data:    the samples (an array or a list of arrays), or a list
+                     of bytes that have been encoded by the codec (e.g.
+                     the contents of the source image files).
+            codec:   the codec name (see register_codec).
+        Providing more configurations for `create_dataset` would override
+        the default configuration (except dtype). If the provided `keyword`
+        exists, the blobs would be appended, and the codec should be the
+        same. If all samples share the same shape, the shape would be
+        stored as the attribute `codec_shape`, which is required by the
+        read selections of H5GParser.
+        '''
+        if self.f is None:
+            raise OSError('Should not dump data before opening a file.')
+        encoder = _h5_get_codec(codec)[0]
+        blobs = np.empty(len(data), dtype=object)
+        shapes = set()
+        for i, sample in enumerate(data):
+            if isinstance(sample, (bytes, bytearray)):
+                shapes.add(None)
+            else:
+                shapes.add(tuple(np.shape(sample)))
+                sample = encoder(sample)
+            blobs[i] = np.frombuffer(sample, dtype=np.uint8)
+        shape = shapes.pop() if len(shapes) == 1 else None
+        if keyword in self.f:
+            ds = self.f[keyword]
+            if ds.attrs.get('codec', None) != codec:
+                raise ValueError('The dataset "{0}" is not encoded by the codec "{1}".'.format(keyword, codec))
+            N = len(ds)
+            ds.resize(N+len(blobs), axis=0)
+            ds[N:N+len(blobs)] = blobs
+            if 'codec_shape' in ds.attrs and (shape is None or tuple(ds.attrs['codec_shape']) != shape):
+                del ds.attrs['codec_shape']
+            if self.f.swmr_mode:
+                ds.flush()
+        else:
+            if self.f.swmr_mode:
+                raise KeyError('Could not create the new dataset "{0}" in the SWMR mode. All datasets should be created before calling start_swmr().'.format(keyword))
+            newkw = self.__kwargs.copy()
+            newkw.update(kwargs)
+            newkw['dtype'] = h5py.vlen_dtype(np.uint8)
+            newkw.setdefault('chunks', True)
+            ds = self.f.create_dataset(keyword, data=blobs, maxshape=(None,), **newkw)
+            ds.attrs['codec'] = codec
+            if shape is not None:
+                ds.attrs['codec_shape'] = shape
+        if self.logver > 0:
+            print('Dump {0} encoded samples into {1}. The data shape is {2} now.'.format(len(blobs), keyword, ds.shape))
+
+    def dump_sparse(self, keyword, data, **kwargs):
+        '''
+        Dump the samples in the compressed sparse row (CSR) format. The
+        keyword would be a group with the datasets `indptr`, `indices`
+        and `data`, and the sample shape would be stored as the attribute
+        `sparse_shape`. The H5GParser would densify the batches or return
+        the sparse tensor values.
+        Arguments:
+            keyword: the keyword of the dumped group.
+            data:    a scipy.sparse matrix with the shape of (N, D), or an
+                     array whose samples would be flattened and converted.
+        Providing more configurations for `create_dataset` (like the
+        compression) would be applied to the datasets. The dtype would be
+        applied to the values. If the provided `keyword` exists, the
+        samples would be appended.
+        '''
+        if self.f is None:
+            raise OSError('Should not dump data before opening a file.')
+        if hasattr(data, 'tocsr'):
+            data = data.tocsr()
+            shape = tuple(data.shape[1:])
+            indptr, indices, values = data.indptr.astype(np.int64), data.indices, data.data
+        else:
+            data = np.asarray(data)
+            shape = tuple(data.shape[1:])
+            data = np.reshape(data, (len(data), -1))
+            rows, indices = np.nonzero(data)
+            values = data[rows, indices]
+            indptr = np.concatenate([[0], np.cumsum(np.bincount(rows, minlength=len(data)))]).astype(np.int64)
+        newkw = self.__kwargs.copy()
+        newkw.update(kwargs)
+        newkw.pop('chunks', None)
+        dtype = newkw.pop('dtype', values.dtype)
+        if keyword in self.f:
+            g = self.f[keyword]
+            if g.attrs.get('format', None) != 'csr' or tuple(g.attrs['sparse_shape']) != shape:
+                raise ValueError('The group "{0}" is not a sparse dataset with the sample shape {1}.'.format(keyword, shape))
+            ptr, ind, val = g['indptr'], g['indices'], g['data']
+            N, M = len(ptr), len(ind)
+            # Write indptr at last, so the SWMR readers would not see incomplete samples.
+            for ds, d in ((ind, indices), (val, values)):
+                ds.resize(M+len(d), axis=0)
+                ds[M:M+len(d)] = d
+            ptr.resize(N+len(indptr)-1, axis=0)
+            ptr[N:] = indptr[1:] + ptr[N-1]
+            if self.f.swmr_mode:
+                for ds in (ind, val, ptr):
+                    ds.flush()
+        else:
+            if self.f.swmr_mode:
+                raise KeyError('Could not create the new dataset "{0}" in the SWMR mode. All datasets should be created before calling start_swmr().'.format(keyword))
+            g = self.f.create_group(keyword)
+            itype = np.int32 if int(np.prod(shape, dtype=np.int64)) < 2**31 else np.int64
+            g.create_dataset('indptr', data=indptr, maxshape=(None,), chunks=True)
+            g.create_dataset('indices', data=np.asarray(indices, dtype=itype), maxshape=(None,), chunks=True, **newkw)
+            g.create_dataset('data', data=np.asarray(values, dtype=dtype), maxshape=(None,), chunks=True, **newkw)
+            g.attrs['format'] = 'csr'
+            g.attrs['sparse_shape'] = shape
+        if self.logver > 0:
+            print('Dump {0} sparse samples into {1}. The data size is {2} now.'.format(len(indptr)-1, keyword, len(g['indptr'])-1))
+
+    def start_swmr(self):
+        '''
+        Start the single-writer/multiple-reader (SWMR) mode. After that, the
+        parsers opened with `swmr=True` could read the file while the data
+        is being dumped. Each dump would be flushed so that the readers could
+        see the new samples after refreshing.
+        Note that no dataset could be created in the SWMR mode, so all
+        keywords should be dumped (at least with one sample) before calling
+        this method. The file should be opened with `swmr=True`.
+        '''
+        if self.f is None:
+            raise OSError('Should not start the SWMR mode before opening a file.')
+        if not self.__swmr:
+            raise OSError('The file should be opened with swmr=True for starting the SWMR mode.')
+        self.f.swmr_mode = True
+        if self.logver > 0:
+            print('Start the SWMR mode.')
+    
+    def open(self, fileName, enableRead=False, swmr=False, index=False):
+        '''
+        The dumped file name (path), it will produce a .h5 file.
+        Arguments:
+            fileName: a path where we save the file.
+            enableRead: when set True, enable the read/write mode.
+                        This option is used when adding data to an
+                        existed file.
+            swmr:       when set True, open the file with the latest
+                        format for supporting the SWMR mode.
+            index:      when set True, write the metadata index when
+                        closing the file.
+        '''
+        if fileName[-3:] != '.h5':
+            fileName += '.h5'
+        self.close()
+        if enableRead:
+            fmode = 'a'
+        else:
+            fmode = 'w'
+        if swmr:
+            self.f = h5py.File(fileName, fmode, libver='latest')
+        else:
+            self.f = h5py.File(fileName, fmode)
+        self.__swmr = swmr
+        self.__index = index
+        if self.logver > 0:
+            print('Open a new file:', fileName)
+        
+    def close(self):
+        if self.f is not None:
+            if self.__index:
+                fileName = self.f.filename
+                datasets = _h5_collect_index(self.f)
+                self.f.close()
+                _h5_write_index(fileName, datasets)
+            else:
+                self.f.close()
+        self.f = None
+        
+def _h5_parallel_worker(args):
+    '''
+    The worker of H5ParallelSaver. Dump the results of a list of tasks into
+    a shard file.
+    '''
+    shardName, func, tasks, config = args
+    saver = H5SupSaver(shardName)
+    saver.config(**config)
+    try:
+        for task in tasks:
+            func(saver, task)
+    finally:
+        saver.close()
+    return shardName
+
+class H5ParallelSaver:
+    '''Save a dataset by multiple processes in parallel
+    Each worker process writes its own shard file by H5SupSaver, so the
+    writing would not be limited by a single file handle. After that,
+    finalize() would create the final file, where each keyword is exposed
+    as one contiguous dataset, i.e. an HDF5 virtual dataset (VDS) mapping
+    the shards in order, or a physical copy merged chunk by chunk. The
+    final file could be read by H5GParser directly.
+    The shard files are named as `{fileName}_shard{rank}.h5`.
+    '''
+    def __init__(self, fileName, numShards):
+        '''
+        Arguments:
+            fileName:  a path where we save the final file.
+            numShards: the number of shards (i.e. the number of workers).
+        '''
+        if fileName[-3:] != '.h5':
+            fileName += '.h5'
+        self.fileName = fileName
+        self.numShards = int(numShards)
+
+    def shard_name(self, rank):
+        '''
+        Get the file name of a shard.
+        '''
+        return '{0}_shard{1:04d}.h5'.format(self.fileName[:-3], rank)
+
+    def saver(self, rank):
+        '''
+        Create the H5SupSaver of a shard. This method should be called in the
+        worker process when users manage the processes by themselves.
+        '''
+        if rank < 0 or rank >= self.numShards:
+            raise ValueError('The rank should be in [0, {0}).'.format(self.numShards))
+        return H5SupSaver(self.shard_name(rank))
+
+    def run(self, func, tasks, workers=None, **config):
+        '''
+        Run the tasks by a process pool, the tasks would be split into the
+        shards in order (the first shard gets the first several tasks).
+        Arguments:
+            func:    a picklable function `func(saver, task)`, where the
+                     saver is the H5SupSaver of the shard. The workers are
+                     spawned, so it should be defined in an importable
+                     module (or guarded by `if __name__ == '__main__'`).
+            tasks:   a list of tasks, no fewer than the shards.
+            workers: the number of worker processes, if not set, use the
+                     number of shards.
+            config:  the configurations applied to each H5SupSaver by
+                     H5SupSaver.config().
+        '''
+        tasks = list(tasks)
+        if len(tasks) < self.numShards:
+            raise ValueError('The number of tasks ({0}) should not be less than the number of shards ({1}).'.format(len(tasks), self.numShards))
+        bounds = np.linspace(0, len(tasks), self.numShards + 1).astype(np.int64)
+        args = [(self.shard_name(i), func, tasks[bounds[i]:bounds[i+1]], config) for i in range(self.numShards)]
+        with _h5_process_pool(workers if workers is not None else self.numShards) as pool:
+            pool.map(_h5_parallel_worker, args)
+
+    def finalize(self, merge=False, keywords=None, chunkSize=None, removeShards=False):
+        '''
+        Create the final file from the shards.
+        Arguments:
+            merge:        if set False, create virtual datasets referring to
+                          the shards (the shards should be kept). If set True,
+                          copy the data into the final file physically.
+            keywords:     the merged keywords. If not set, use all datasets of
+                          the first shard.
+            chunkSize:    the number of samples copied in each step when
+                          merging. If not set, use the chunk layout.
+            removeShards: remove the shard files after the physical merge.
+        All shards should exist and contain all keywords, otherwise an error
+        would be raised (e.g. when a worker crashed).
+        '''
+        shards = [self.shard_name(i) for i in range(self.numShards)]
+        missing = [s for s in shards if not os.path.isfile(s)]
+        if missing:
+            raise FileNotFoundError('Could not find the shards of {0}: {1}.'.format(self.fileName, missing))
+        folder = os.path.dirname(os.path.abspath(self.fileName))
+        with h5py.File(self.fileName, 'w', libver='latest') as f:
+            hshards = [h5py.File(s, 'r') for s in shards]
+            try:
+                if keywords is None:
+                    keywords = [k for k in hshards[0].keys() if isinstance(hshards[0][k], h5py.Dataset)]
+                for key in keywords:
+                    missing = [h.filename for h in hshards if not isinstance(h.get(key, None), h5py.Dataset)]
+                    if missing:
+                        raise KeyError('The keyword "{0}" is missing in the shards: {1}.'.format(key, missing))
+                    dsets = [h[key] for h in hshards]
+                    shape = dsets[0].shape[1:]
+                    attrs = {k: v for k, v in dsets[0].attrs.items() if k.startswith('quant_')}
+                    for dset in dsets:
+                        if dset.shape[1:] != shape or dset.dtype != dsets[0].dtype:
+                            raise ValueError('The shards of "{0}" do not share the same shape and type.'.format(key))
+                        dattrs = {k: v for k, v in dset.attrs.items() if k.startswith('quant_')}
+                        if dattrs.keys() != attrs.keys() or any(np.any(dattrs[k] != attrs[k]) for k in attrs):
+                            raise ValueError('The shards of "{0}" are quantized by different parameters.'.format(key))
+                    total = sum(len(dset) for dset in dsets)
+                    if merge:
+                        ds = f.create_dataset(key, shape=(total, *shape), maxshape=(None, *shape), dtype=dsets[0].dtype,
+                                              chunks=dsets[0].chunks if dsets[0].chunks is not None else True,
+                                              compression=dsets[0].compression, compression_opts=dsets[0].compression_opts, shuffle=dsets[0].shuffle)
+                        N = 0
+                        for dset in dsets:
+                            _h5_copy_chunks(ds, dset, N, chunkSize)
+                            N += len(dset)
+                    else:
+                        layout = h5py.VirtualLayout(shape=(total, *shape), dtype=dsets[0].dtype)
+                        N = 0
+                        for dset in dsets:
+                            src = os.path.relpath(os.path.abspath(dset.file.filename), folder)
+                            layout[N:N+len(dset)] = h5py.VirtualSource(src, key, shape=dset.shape)
+                            N += len(dset)
+                        ds = f.create_virtual_dataset(key, layout)
+                    for k, v in attrs.items():
+                        ds.attrs[k] = v
+            finally:
+                for h in hshards:
+                    h.close()
+        if merge and removeShards:
+            for s in shards:
+                os.remove(s)
+
+def _h5stats_flatten(data, channelAxis):
+    '''
+    Flatten a block of samples into a (M, C) matrix, where C is the
+    channel number along the `channelAxis`.
+    '''
+    if channelAxis is None:
+        return np.reshape(data, (-1, 1))
+    data = np.moveaxis(data, channelAxis, -1)
+    return np.reshape(data, (-1, data.shape[-1]))
+
+def _h5stats_chunk(args):
+    '''
+    Compute the partial statistics of a block of samples. This function
+    is used by the workers of `H5Statistics`.
+    Returns:
+        (count, mean, m2, min, max, hist)
+    '''
+    fileName, keyword, start, stop, channelAxis, histRange, histBins = args
+    with h5py.File(fileName, 'r') as f:
+        dset = f[keyword]
+        data = np.asarray(dset[start:stop], dtype=np.float64)
+        if 'quant_scale' in dset.attrs: # Compute the statistics of the dequantized data.
+            bshape = [1] * data.ndim
+            if 'quant_axis' in dset.attrs:
+                bshape[int(dset.attrs['quant_axis'])] = -1
+            data = data * np.reshape(dset.attrs['quant_scale'], bshape) + np.reshape(dset.attrs['quant_offset'], bshape)
+    data = _h5stats_flatten(data, channelAxis)
+    count = data.shape[0]
+    mean = np.mean(data, axis=0)
+    m2 = np.sum(np.square(data - mean), axis=0)
+    hist = None
+    if histRange is not None:
+        lo, hi = histRange
+        width = np.where(hi > lo, hi - lo, 1.0)
+        bins = np.floor((data - lo) / width * histBins).astype(np.int64)
+        np.clip(bins, 0, histBins - 1, out=bins)
+        bins += np.arange(data.shape[1], dtype=np.int64) * histBins
+        hist = np.bincount(bins.ravel(), minlength=data.shape[1] * histBins)
+        hist = np.reshape(hist, (data.shape[1], histBins))
+    return count, mean, m2, np.amin(data, axis=0), np.amax(data, axis=0), hist
+
+def _h5stats_merge(stat_a, stat_b):
+    '''
+    Merge two partial statistics by the parallel Welford algorithm.
+    '''
+    if stat_a is None:
+        return stat_b
+    n_a, mean_a, m2_a, min_a, max_a, hist_a = stat_a
+    n_b, mean_b, m2_b, min_b, max_b, hist_b = stat_b
+    n = n_a + n_b
+    delta = mean_b - mean_a
+    mean = mean_a + delta * (n_b / n)
+    m2 = m2_a + m2_b + np.square(delta) * (n_a * n_b / n)
+    hist = hist_a + hist_b if hist_a is not None else None
+    return n, mean, m2, np.minimum(min_a, min_b), np.maximum(max_a, max_b), hist
+
+class H5Statistics:
+    '''Compute the statistics of datasets in a .h5 file
+    This class is used for calculating the per-channel statistics,
+    i.e. the mean, standard deviation, minimum and maximum, of the
+    datasets written by H5SupSaver. The statistics are computed in a
+    streaming way: each dataset would be read chunk by chunk, and the
+    partial results of chunks would be merged by the Welford algorithm,
+    so the data would never be loaded into the memory at once. The
+    chunks could be processed by a process pool in parallel.
+    The results would be stored as the attributes of each dataset:
+        stats_count, stats_mean, stats_std, stats_min, stats_max
+    and optionally
+        stats_hist, stats_hist_edges, stats_quantiles,
+        stats_quantile_levels
+    These attributes could be used by H5GParser (with the `normalize`
+    option) to normalize the batches on the fly. The pyramid levels of
+    the keywords (built by H5Pyramid) would be also computed.
+    '''
+    def __init__(self, fileName, keywords=None, channelAxis=-1, chunkSize=None, workers=None):
+        '''
+        Create the statistic collector.
+        Arguments:
+            fileName:    the data path of the file (could be without postfix).
+            keywords:    a list of keywords (or a single keyword). If not set,
+                         all datasets in the root of the file would be used.
+            channelAxis: the channel axis of the dataset (the sample axis is
+                         axis 0, so this value could not be 0). If set None,
+                         the statistics would be computed over all values.
+            chunkSize:   the number of samples in each processed chunk. If
+                         not set, it would be estimated from the chunk layout
+                         of the dataset so that each chunk is about 32 MB.
+            workers:     the number of worker processes. If set 0, the chunks
+                         would be processed in the current process. If not set,
+                         use the number of CPU cores.
+        '''
+        if (not os.path.isfile(fileName)) and (os.path.isfile(fileName+'.h5')):
+            fileName += '.h5'
+        if not os.path.isfile(fileName):
+            raise FileNotFoundError('Could not read the HDF5 dataset: {0}.'.format(fileName))
+        if channelAxis == 0:
+            raise ValueError('Channel axis cannot be zero, because axis 0 is the sample axis.')
+        self.fileName = fileName
+        with h5py.File(fileName, 'r') as f:
+            if keywords is None:
+                keywords = tuple(k for k in f.keys() if isinstance(f[k], h5py.Dataset))
+            elif isinstance(keywords, str):
+                keywords = (keywords,)
+            for key in keywords:
+                if not isinstance(f.get(key, None), h5py.Dataset):
+                    raise KeyError('The keyword "{0}" is not mapped to a dataset in the file.'.format(key))
+        self.keywords = tuple(keywords)
+        self.channelAxis = channelAxis
+        self.chunkSize = chunkSize
+        self.workers = os.cpu_count() if workers is None else workers
+
+    def __chunks(self, dset):
+        '''
+        Split the sample axis of a dataset into chunk ranges.
+        '''
+        size = len(dset)
+        chunkSize = self.chunkSize
+        if chunkSize is None:
+            smpBytes = max(int(np.prod(dset.shape[1:], dtype=np.int64)) * dset.dtype.itemsize, 1)
+            chunkSize = max((32 * 1024 * 1024) // smpBytes, 1)
+            if dset.chunks is not None: # Align the reading ranges with the file chunks.
+                chunkSize = max(chunkSize // dset.chunks[0], 1) * dset.chunks[0]
+        return [(s, min(s + chunkSize, size)) for s in range(0, size, chunkSize)]
+
+    def __channelAxis(self, dset):
+        '''
+        Get the positive channel axis of a dataset. The dataset without any
+        channel axis (i.e. 1D dataset) would return None.
+        '''
+        if self.channelAxis is None or dset.ndim < 2:
+            return None
+        channelAxis = self.channelAxis % dset.ndim
+        if channelAxis == 0:
+            raise ValueError('Channel axis cannot be the sample axis of the dataset "{0}".'.format(dset.name))
+        return channelAxis
+
+    def __reduce(self, keyword, histRange=None, histBins=None):
+        '''
+        Run one streaming pass over a dataset.
+        '''
+        with h5py.File(self.fileName, 'r') as f:
+            chunks = self.__chunks(f[keyword])
+            channelAxis = self.__channelAxis(f[keyword])
+        tasks = [(self.fileName, keyword, s, e, channelAxis, histRange, histBins) for s, e in chunks]
+        res = None
+        if self.workers and self.workers > 1 and len(tasks) > 1:
+            with _h5_process_pool(min(self.workers, len(tasks))) as pool:
+                for stat in pool.imap_unordered(_h5stats_chunk, tasks):
+                    res = _h5stats_merge(res, stat)
+        else:
+            for t in tasks:
+                res = _h5stats_merge(res, _h5stats_chunk(t))
+        if res is None:
+            raise ValueError('The dataset "{0}" is empty.'.format(keyword))
+        return res
+
+    @staticmethod
+    def __quantiles(hist, edges, levels):
+        '''
+        Estimate the quantiles from the histograms (one row for each channel)
+        by the linear interpolation on the cumulative distribution.
+        '''
+        res = np.zeros((hist.shape[0], len(levels)), dtype=np.float64)
+        for c in range(hist.shape[0]):
+            cdf = np.concatenate([[0.0], np.cumsum(hist[c])]) / max(np.sum(hist[c]), 1)
+            cdf, ind = np.unique(cdf, return_index=True)
+            res[c] = np.interp(levels, cdf, edges[c][ind])
+        return res
+
+    def compute(self, histBins=None, histRange=None, quantiles=None, store=True):
+        '''
+        Compute the statistics of all keywords.
+        Arguments:
+            histBins:  the number of histogram bins. If set, the histogram of
+                       each channel would be computed.
+            histRange: the (min, max) range of the histogram. If not set, the
+                       range would be the range of each channel, which requires
+                       one more streaming pass.
+            quantiles: a list of quantile levels in [0, 1]. The quantiles are
+                       estimated from the histograms (1024 bins by default).
+            store:     if set True, store the results as dataset attributes.
+        Returns:
+            a dictionary mapping each keyword to a dictionary of statistics.
+        '''
+        if quantiles is not None and histBins is None:
+            histBins = 1024
+        keywords = list(self.keywords)
+        with h5py.File(self.fileName, 'r') as f:
+            for key in self.keywords:
+                for lv in range(1, int(f[key].attrs.get('pyramid_levels', 0)) + 1):
+                    name = _h5_pyramid_name(key, lv)
+                    if name in f and name not in keywords:
+                        keywords.append(name)
+        results = dict()
+        for key in keywords:
+            n, mean, m2, vmin, vmax, _ = self.__reduce(key)
+            stats = {
+                'stats_count': n,
+                'stats_mean': mean,
+                'stats_std': np.sqrt(m2 / n),
+                'stats_min': vmin,
+                'stats_max': vmax
+            }
+            if histBins is not None:
+                if histRange is None:
+                    hrange = (vmin, vmax)
+                else:
+                    hrange = (np.full_like(vmin, histRange[0]), np.full_like(vmax, histRange[1]))
+                hist = self.__reduce(key, hrange, histBins)[-1]
+                edges = np.linspace(0.0, 1.0, histBins + 1)[np.newaxis, :] * (hrange[1] - hrange[0])[:, np.newaxis] + hrange[0][:, np.newaxis]
+                stats['stats_hist'] = hist
+                stats['stats_hist_edges'] = edges
+                if quantiles is not None:
+                    levels = np.asarray(quantiles, dtype=np.float64)
+                    stats['stats_quantiles'] = self.__quantiles(hist, edges, levels)
+                    stats['stats_quantile_levels'] = levels
+            results[key] = stats
+        if store:
+            with h5py.File(self.fileName, 'a') as f:
+                for key, stats in results.items():
+                    attrs = f[key].attrs
+                    for name in [a for a in attrs.keys() if a.startswith('stats_')]:
+                        del attrs[name]
+                    for name, value in stats.items():
+                        attrs[name] = value
+                    channelAxis = self.__channelAxis(f[key])
+                    if channelAxis is not None:
+                        attrs['stats_axis'] = channelAxis
+        return results
+
+def _h5_pyramid_name(keyword, level):
+    '''
+    Get the name of the dataset of a pyramid level. The level 0 is the
+    original dataset.
+    '''
+    if level == 0:
+        return keyword
+    return '{0}_pyramid{1}'.format(keyword, level)
+
+def _h5_gaussian_kernel(factor):
+    '''
+    Get the 1D Gaussian kernel used for downsampling by `factor`.
+    '''
+    sigma = 0.5 * factor
+    radius = int(np.ceil(3 * sigma))
+    kernel = np.exp(-0.5 * np.square(np.arange(-radius, radius + 1) / sigma))
+    return kernel / np.sum(kernel)
+
+def _h5_downsample(data, factor, axes, filter):
+    '''
+    Downsample a block of samples along the spatial axes by `factor`. The
+    size of each axis would be floor(size / factor).
+    '''
+    data = np.asarray(data, dtype=np.float32)
+    if filter == 'box':
+        for a in axes:
+            n = data.shape[a] // factor
+            data = np.take(data, np.arange(n * factor), axis=a)
+            shape = data.shape[:a] + (n, factor) + data.shape[a+1:]
+            data = np.mean(np.reshape(data, shape), axis=a+1)
+    elif filter == 'gaussian':
+        kernel = _h5_gaussian_kernel(factor)
+        radius = len(kernel) // 2
+        for a in axes:
+            n = data.shape[a] // factor
+            pad = [(0, 0)] * data.ndim
+            pad[a] = (radius, radius)
+            padded = np.pad(data, pad, mode='reflect' if data.shape[a] > radius else 'edge')
+            # Only compute the blurred values at the sampled positions.
+            pos = np.arange(n) * factor + factor // 2
+            res = 0.0
+            for k, w in enumerate(kernel):
+                res = res + w * np.take(padded, pos + k, axis=a)
+            data = res
+    else:
+        raise ValueError('The filter "{0}" is not supported, should be \'box\' or \'gaussian\'.'.format(filter))
+    return data
+
+class H5Pyramid:
+    '''Build the resolution pyramids of datasets in a .h5 file
+    For each keyword, the downsampled versions (by factor, factor^2, ...)
+    would be stored as the sibling datasets named as
+        {keyword}_pyramid{level}
+    The pyramid is built in a streaming way, i.e. the samples would be
+    read chunk by chunk, and each level would be computed from the
+    previous level of the same chunk. H5GParser could read a chosen level
+    by the `level` option.
+    The quantization attributes (if exist) would be copied to the levels,
+    and the quantized levels would be rounded into the stored type. If the
+    dataset has the statistics computed by H5Statistics, the statistics of
+    the levels would be computed by the same configurations.
+    '''
+    def __init__(self, fileName, keywords, levels=3, factor=2, spatialAxes=None, filter='box', chunkSize=None):
+        '''
+        Create the pyramid builder.
+        Arguments:
+            fileName:    the data path of the file (could be without postfix).
+            keywords:    a list of keywords (or a single keyword).
+            levels:      the number of the downsampled levels.
+            factor:      the downsampling factor between two levels.
+            spatialAxes: the downsampled axes (the sample axis is 0). If not
+                         set, use all axes except the sample axis and the
+                         last (channel) axis.
+            filter:      'box' (averaging) or 'gaussian' (Gaussian blurring
+                         before subsampling).
+            chunkSize:   the number of samples in each processed chunk. If
+                         not set, use the chunk layout of the dataset.
+        '''
+        if (not os.path.isfile(fileName)) and (os.path.isfile(fileName+'.h5')):
+            fileName += '.h5'
+        if not os.path.isfile(fileName):
+            raise FileNotFoundError('Could not read the HDF5 dataset: {0}.'.format(fileName))
+        if filter not in ('box', 'gaussian'):
+            raise ValueError('The filter "{0}" is not supported, should be \'box\' or \'gaussian\'.'.format(filter))
+        self.fileName = fileName
+        self.keywords = (keywords,) if isinstance(keywords, str) else tuple(keywords)
+        self.levels = int(levels)
+        self.factor = int(factor)
+        self.spatialAxes = spatialAxes
+        self.filter = filter
+        self.chunkSize = chunkSize
+
+    def build(self):
+        '''
+        Build the pyramids of all keywords. The existed levels would be
+        replaced.
+        '''
+        with h5py.File(self.fileName, 'a') as f:
+            for key in self.keywords:
+                self.__build(f, key)
+            stats = [(key, dict(f[key].attrs)) for key in self.keywords if 'stats_mean' in f[key].attrs]
+        # The downsampling changes the std. and the range, so the statistics are recomputed.
+        for key, attrs in stats:
+            histBins = attrs['stats_hist'].shape[-1] if 'stats_hist' in attrs else None
+            quantiles = attrs.get('stats_quantile_levels', None)
+            channelAxis = int(attrs['stats_axis']) if 'stats_axis' in attrs else None
+            names = [_h5_pyramid_name(key, lv) for lv in range(1, self.levels + 1)]
+            H5Statistics(self.fileName, names, channelAxis=channelAxis, chunkSize=self.chunkSize, workers=0).compute(histBins=histBins, quantiles=quantiles)
+
+    def __build(self, f, key):
+        dset = f[key]
+        ndim = dset.ndim
+        if self.spatialAxes is None:
+            axes = tuple(range(1, ndim - 1)) if ndim > 2 else tuple(range(1, ndim))
+        else:
+            axes = tuple(a % ndim for a in self.spatialAxes)
+        if 0 in axes or not axes:
+            raise ValueError('The spatial axes should be not empty, and not contain the sample axis.')
+        # Remove the outdated levels.
+        for lv in range(self.levels + 1, int(dset.attrs.get('pyramid_levels', 0)) + 1):
+            if _h5_pyramid_name(key, lv) in f:
+                del f[_h5_pyramid_name(key, lv)]
+        # Create the datasets of the levels.
+        lvsets = []
+        shape = list(dset.shape)
+        for lv in range(1, self.levels + 1):
+            for a in axes:
+                shape[a] = shape[a] // self.factor
+            if any(shape[a] == 0 for a in axes):
+                raise ValueError('The dataset "{0}" is too small for {1} levels.'.format(key, self.levels))
+            name = _h5_pyramid_name(key, lv)
+            if name in f:
+                del f[name]
+            chunks = True if dset.chunks is None else tuple(min(c, s) for c, s in zip(dset.chunks, shape))
+            lvset = f.create_dataset(name, shape=tuple(shape), maxshape=(None, *shape[1:]), dtype=dset.dtype, chunks=chunks,
+                                     compression=dset.compression, compression_opts=dset.compression_opts, shuffle=dset.shuffle)
+            for attr in ('quant_scale', 'quant_offset', 'quant_axis'):
+                if attr in dset.attrs:
+                    lvset.attrs[attr] = dset.attrs[attr]
+            lvsets.append(lvset)
+        # Stream the samples chunk by chunk.
+        chunkSize = self.chunkSize
+        if chunkSize is None:
+            chunkSize = dset.chunks[0] if dset.chunks is not None else 1
+        for s in range(0, len(dset), chunkSize):
+            data = dset[s:s+chunkSize]
+            for lvset in lvsets:
+                data = _h5_downsample(data, self.factor, axes, self.filter)
+                if lvset.dtype.kind in 'iu':
+                    info = np.iinfo(lvset.dtype)
+                    lvset[s:s+chunkSize] = np.clip(np.rint(data), info.min, info.max).astype(lvset.dtype)
+                else:
+                    lvset[s:s+chunkSize] = data.astype(lvset.dtype)
+        dset.attrs['pyramid_levels'] = self.levels
+        dset.attrs['pyramid_factor'] = self.factor
+        dset.attrs['pyramid_axes'] = axes
+
+def _h5_repack_chunks(shape, itemsize, stats=None, selection=None, chunkBytes=2**20):
+    '''
+    Choose the chunk shape of a repacked dataset. Without the access
+    statistics, each chunk contains the whole samples, and its size is
+    about `chunkBytes`. With the statistics, the random batches would
+    be stored by one sample in each chunk (the contiguous batches by
+    the batch size), the axes selected by index lists would be split
+    into single indices, and the axes selected by slices would be
+    split by the slice length.
+    '''
+    shape = tuple(int(s) for s in shape)
+    sampleBytes = max(int(np.prod(shape[1:], dtype=np.int64)) * itemsize, 1)
+    if stats is None:
+        rows = max(1, chunkBytes // sampleBytes)
+        return (min(rows, max(shape[0], 1)), *shape[1:])
+    if stats['batches'] > 0 and stats['contiguous'] * 2 > stats['batches']:
+        rows = max(1, int(round(stats['samples'] / stats['batches'])))
+    else:
+        rows = 1
+    chunks = [min(rows, max(shape[0], 1))] + list(shape[1:])
+    if selection is not None:
+        for axis, item in enumerate(selection, 1):
+            if isinstance(item, (list, tuple)) and len(item) == 3 and item[0] == 'slice':
+                start, stop, step = slice(*item[1:]).indices(shape[axis])
+                chunks[axis] = max(1, min(stop - start, shape[axis]))
+            elif item is not None and len(item) * 2 < shape[axis]:
+                chunks[axis] = 1
+    # Split the largest axis until the chunk is small enough.
+    while int(np.prod(chunks, dtype=np.int64)) * itemsize > 4 * chunkBytes:
+        axis = int(np.argmax(chunks[1:])) + 1
+        if chunks[axis] <= 1:
+            break
+        chunks[axis] = (chunks[axis] + 1) // 2
+    return tuple(chunks)
+
+def _h5_read_blocks(dset, indices, blockSize):
+    '''
+    Read the samples of `indices` by contiguous reads. The indices are sorted
+    and grouped by the blocks of `blockSize` samples (aligned to the chunks),
+    the touched span of each block is read by a slice, and the samples are
+    picked in memory. This avoids the point selection of HDF5, which is very
+    slow when the indices are many and scattered.
+    '''
+    indices = np.asarray(indices, dtype=np.int64)
+    res = np.empty((len(indices), *dset.shape[1:]), dtype=dset.dtype)
+    if len(indices) == 0:
+        return res
+    perm = np.argsort(indices, kind='stable')
+    sind = indices[perm]
+    blocks = sind // blockSize
+    for pos in np.split(np.arange(len(sind)), np.flatnonzero(np.diff(blocks)) + 1):
+        lo, hi = sind[pos[0]], sind[pos[-1]] + 1
+        res[perm[pos]] = dset[lo:hi][sind[pos] - lo]
+    return res
+
+def _h5_repack_worker(args):
+    '''
+    The worker of H5Repacker. Rewrite a dataset into a temporary file
+    block by block. When the samples are reordered, the source is read by
+    the chunk-aligned slices (see _h5_read_blocks).
+    '''
+    fileName, tmpName, name, order, chunks, kwargs, maxBytes = args
+    with h5py.File(fileName, 'r') as f, h5py.File(tmpName, 'w') as ft:
+        dset = f[name]
+        ds = ft.create_dataset('data', shape=dset.shape, maxshape=(None, *dset.shape[1:]), dtype=dset.dtype, chunks=chunks, **kwargs)
+        for attr, val in dset.attrs.items():
+            ds.attrs[attr] = val
+        sampleBytes = max(int(np.prod(dset.shape[1:], dtype=np.int64)) * dset.dtype.itemsize, 1)
+        step = max(1, maxBytes // sampleBytes)
+        step = max(chunks[0], step - step % chunks[0])
+        blockSize = min(dset.chunks[0], step) if dset.chunks is not None else step
+        for s in range(0, len(dset), step):
+            e = min(s + step, len(dset))
+            if order is None:
+                ds[s:e] = dset[s:e]
+            else:
+                ds[s:e] = _h5_read_blocks(dset, order[s:e], blockSize)
+    return name
+
+class H5Repacker:
+    '''Repack datasets with a new layout
+    Files written before tuning may have poor chunk layouts for the
+    parsers. This tool rewrites the datasets of a file into a new file
+    with a new chunk shape, compression and sample ordering. The samples
+    are copied block by block, so the memory is bounded by `maxBytes` for
+    each worker, and the datasets are processed by a process pool in
+    parallel (each worker writes a temporary file, and the results are
+    copied into the output file chunk by chunk by HDF5).
+    The chunk shapes could be chosen by the access statistics recorded
+    by H5GParser (see H5GParser.access_stats()).
+    '''
+    def __init__(self, fileName, outName, keywords=None, chunks=None, order=None, groupKeyword=None, stats=None,
+                 workers=None, maxBytes=2**28, seed=None, **kwargs):
+        '''
+        Create the repacker.
+        Arguments:
+            fileName:     the data path of the source file (could be
+                          without postfix).
+            outName:      the path of the output file.
+            keywords:     the repacked keywords. If not set, use all
+                          datasets in the file.
+            chunks:       the new chunk shape (a tuple), or a dict mapping
+                          the keywords to the chunk shapes. The keywords
+                          not specified would use the chunk shapes chosen
+                          automatically (see `stats`).
+            order:        the new sample ordering. It could be None (keep
+                          the order), 'shuffle' (pre-shuffle the samples),
+                          'group' (group the samples by the labels of
+                          `groupKeyword`, and shuffle the samples in each
+                          group), or an array of the source indices.
+            groupKeyword: the keyword of the labels used by the 'group'
+                          order. The label of each sample is the scalar, or
+                          the argmax of the (one-hot) vector.
+            stats:        the access statistics returned by
+                          H5GParser.access_stats(). If provided, the chunk
+                          shapes of the recorded keywords would be chosen
+                          for the recorded batch sizes and selections.
+            workers:      the number of worker processes.
+            maxBytes:     the maximal bytes of each copied block.
+            seed:         the random seed of the orders.
+        Other keyword arguments (like `compression`, `compression_opts`,
+        `shuffle`) would be passed to `create_dataset`.
+        '''
+        if (not os.path.isfile(fileName)) and (os.path.isfile(fileName+'.h5')):
+            fileName += '.h5'
+        if not os.path.isfile(fileName):
+            raise FileNotFoundError('Could not read the HDF5 dataset: {0}.'.format(fileName))
+        if os.path.realpath(fileName) == os.path.realpath(outName):
+            raise FileExistsError('The output file should be different from the source file.')
+        self.fileName = fileName
+        self.outName = outName
+        self.keywords = (keywords,) if isinstance(keywords, str) else keywords
+        self.chunks = chunks
+        self.order = order
+        self.groupKeyword = groupKeyword
+        self.stats = stats
+        self.workers = workers
+        self.maxBytes = int(maxBytes)
+        self.seed = seed
+        self.__kwargs = kwargs
+
+    def __createOrder(self, f, size):
+        '''
+        Create the array of the source indices for the new ordering.
+        '''
+        rng = np.random.RandomState(self.seed)
+        if self.order is None:
+            return None
+        elif isinstance(self.order, str) and self.order == 'shuffle':
+            return rng.permutation(size)
+        elif isinstance(self.order, str) and self.order == 'group':
+            if self.groupKeyword is None:
+                raise ValueError('The \'group\' order requires groupKeyword.')
+            labels = f[self.groupKeyword][()]
+            if labels.ndim > 1:
+                labels = np.argmax(np.reshape(labels, (len(labels), -1)), axis=-1)
+            perm = rng.permutation(size)
+            return perm[np.argsort(labels[perm], kind='stable')]
+        order = np.asarray(self.order, dtype=np.int64)
+        if len(order) != size or not np.array_equal(np.sort(order), np.arange(size)):
+            raise ValueError('The order should be a permutation of the sample indices.')
+        return order
+
+    def __chunks(self, name, dset):
+        '''
+        Find the chunk shape of a dataset.
+        '''
+        if isinstance(self.chunks, dict):
+            if name in self.chunks:
+                return tuple(self.chunks[name])
+        elif self.chunks is not None:
+            return tuple(self.chunks)
+        if self.stats is not None and name in self.stats['keywords']:
+            selection = self.stats['selections'][self.stats['keywords'].index(name)]
+            return _h5_repack_chunks(dset.shape, dset.dtype.itemsize, self.stats, selection)
+        return _h5_repack_chunks(dset.shape, dset.dtype.itemsize)
+
+    def run(self):
+        '''
+        Repack the datasets, and return the array of the source indices of
+        the new ordering (None if the order is kept).
+        '''
+        with h5py.File(self.fileName, 'r') as f:
+            keywords = self.keywords
+            if keywords is None:
+                index = _h5_read_index(self.fileName)
+                keywords = [d[0] for d in index] if index is not None else [d[0] for d in _h5_collect_index(f)]
+            size = len(f[keywords[0]])
+            if self.order is not None:
+                for key in keywords:
+                    if len(f[key]) != size:
+                        raise TypeError('The reordered keywords do not correspond to each other.')
+            order = self.__createOrder(f, size)
+            tasks = []
+            for i, key in enumerate(keywords):
+                dset = f[key]
+                tasks.append((self.fileName, '{0}.part{1}.h5'.format(self.outName, i), key, order, self.__chunks(key, dset),
+                              self.__kwargs, self.maxBytes))
+            rootAttrs = dict(f.attrs.items())
+        try:
+            with _h5_process_pool(self.workers) as pool:
+                for name in pool.imap_unordered(_h5_repack_worker, tasks):
+                    print('Have repacked {0}'.format(name))
+            with h5py.File(self.outName, 'w') as fo:
+                for attr, val in rootAttrs.items():
+                    fo.attrs[attr] = val
+                for task in tasks:
+                    tmpName, name = task[1], task[2]
+                    parent = os.path.dirname(name.strip('/'))
+                    if parent:
+                        fo.require_group(parent)
+                    with h5py.File(tmpName, 'r') as ft:
+                        ft.copy(ft['data'], fo, name=name)
+        finally:
+            for task in tasks:
+                if os.path.isfile(task[1]):
+                    os.remove(task[1])
+        return order
+
+class _H5AsyncSequence:
+    '''Mixin of asyncio batch iterators
+    This class provides `aiter()` for the parsers, so that the batches
+    could be consumed by `async for` in an asyncio service. The reading
+    is scheduled on an executor, so a blocking read would not stall the
+    event loop, and the iterators of multiple parsers could run con-
+    currently in the same loop.
+    '''
+    async def _aget(self, loop, executor, idx):
+        '''
+        Get the batch `idx` without blocking the event loop. This method
+        could be overriden when the sequence could be read concurrently.
+        '''
+        return await loop.run_in_executor(executor, self.__getitem__, idx)
+
+    async def aiter(self, prefetch=2, executor=None, epochs=1):
+        '''
+        Iterate the batches asynchronously, i.e.
+            async for batch in parser.aiter(prefetch=2):
+                ...
+        A producer task would read the batches in order, and put them into a
+        queue with the size of `prefetch`. When the queue is full, the pro-
+        ducer would wait for the consumer (backpressure). At the end of each
+        epoch, `on_epoch_end()` would be called by the producer, so the next
+        epoch would not be read before the shuffling.
+        If the iteration is stopped (by `break`, `aclose()` or cancelling the
+        consumer task), the producer would be cancelled, and the remaining
+        batches would be dropped.
+        Arguments:
+            prefetch: the maximal number of batches read ahead of the consumer.
+            executor: the executor used for reading. If not set, use the
+                      default executor of the event loop.
+            epochs:   the number of iterated epochs. If set None, iterate the
+                      batches endlessly.
+        '''
+        if prefetch < 1:
+            raise ValueError('The prefetch number should be at least 1.')
+        loop = asyncio.get_event_loop()
+        queue = asyncio.Queue(maxsize=prefetch)
+        endFlag = object()
+        async def produce():
+            try:
+                epoch = 0
+                while epochs is None or epoch < epochs:
+                    for idx in range(len(self)):
+                        await queue.put((await self._aget(loop, executor, idx), None))
+                    await loop.run_in_executor(executor, self.on_epoch_end)
+                    epoch += 1
+                await queue.put((endFlag, None))
+            except asyncio.CancelledError:
+                raise
+            except Exception as err:
+                await queue.put((endFlag, err))
+        producer = asyncio.ensure_future(produce())
+        try:
+            while True:
+                res, err = await queue.get()
+                if res is endFlag:
+                    if err is not None:
+                        raise err
+                    break
+                yield res
+        finally:
+            producer.cancel()
+            try: # Wait the producer to exit, so the reading would not outlive the iterator.
+                await producer
+            except (asyncio.CancelledError, Exception): # pylint: disable=broad-except
+                pass
+
+class _H5FilePool:
+    '''Process-wide pool of the read-only file handles
+    The parsers reading the same file (with the same SWMR mode) share one
+    file handle. Since HDF5 keeps a chunk cache for each opened dataset,
+    the dataset handles are also shared, so the parsers reading the same
+    chunks (e.g. the train set and the valid set of H5VGParser) decompress
+    each chunk only once. The chunk cache of the shared handles is larger
+    than the default one (1 MB). The handles are reference counted, and
+    closed when the last parser releases them. The handles are not shared
+    between processes.
+    '''
+    CACHE_BYTES = 64 * 2**20
+    CACHE_SLOTS = 100003
+
+    def __init__(self):
+        self.__entries = dict()
+        self.__keys = dict()
+        self.__lock = threading.Lock()
+
+    def acquire(self, fileName, swmr=False):
+        '''
+        Get the shared handle of a file, and increase its reference count.
+        '''
+        key = (os.getpid(), os.path.realpath(fileName), bool(swmr))
+        with self.__lock:
+            entry = self.__entries.get(key, None)
+            if entry is None or not entry[0]:
+                if entry is not None: # The handle is closed outside the pool.
+                    self.__keys.pop(id(entry[0]), None)
+                kwargs = {'rdcc_nbytes': self.CACHE_BYTES, 'rdcc_nslots': self.CACHE_SLOTS}
+                if swmr:
+                    f = h5py.File(fileName, 'r', libver='latest', swmr=True, **kwargs)
+                else:
+                    f = h5py.File(fileName, 'r', **kwargs)
+                entry = [f, 0, dict()]
+                self.__entries[key] = entry
+                self.__keys[id(f)] = key
+            entry[1] += 1
+            return entry[0]
+
+    def dataset(self, f, name):
+        '''
+        Get the shared dataset handle from a shared file handle. If the file
+        handle is not from the pool, open the dataset directly.
+        '''
+        with self.__lock:
+            entry = self.__entries.get(self.__keys.get(id(f), None), None)
+            if entry is None or entry[0] is not f:
+                return f[name]
+            dset = entry[2].get(name, None)
+            if dset is None:
+                dset = entry[2][name] = f[name]
+            return dset
+
+    def release(self, f):
+        '''
+        Decrease the reference count of a shared handle, and close it if it
+        is not used anymore.
+        '''
+        with self.__lock:
+            key = self.__keys.get(id(f), None)
+            entry = self.__entries.get(key, None)
+            if entry is None or entry[0] is not f:
+                f.close()
+                return
+            entry[1] -= 1
+            if entry[1] <= 0:
+                del self.__entries[key]
+                del self.__keys[id(f)]
+                entry[2].clear()
+                f.close()
+
+_H5_FILE_POOL = _H5FilePool()
+
+def _h5_concat_ranges(starts, counts):
+    '''
+    Concatenate the ranges [starts[i], starts[i]+counts[i]) by one
+    vectorized operation.
+    '''
+    counts = np.asarray(counts, dtype=np.int64)
+    offsets = np.cumsum(counts) - counts
+    return np.arange(int(np.sum(counts)), dtype=np.int64) + np.repeat(np.asarray(starts, dtype=np.int64) - offsets, counts)
+
+class _H5CSRDataset:
+    '''Sparse samples stored in the CSR format
+    The samples are stored in a group (dumped by H5SupSaver.dump_sparse)
+    with the datasets `indptr`, `indices` and `data`, where the non-zero
+    values of the i-th sample are `data[indptr[i]:indptr[i+1]]`, located
+    at the flattened positions `indices[indptr[i]:indptr[i+1]]`. This
+    class provides the attributes of a dataset used by the parsers. When
+    reading a batch, the rows of the batch are read by the merged spans
+    (the spans closer than `GAP` are read together).
+    '''
+    GAP = 4096
+
+    def __init__(self, group):
+        self.group = group
+        self.name = group.name
+        self.attrs = group.attrs
+        self.__indptr = group['indptr']
+        self.__indices = group['indices']
+        self.__data = group['data']
+        self.sampleShape = tuple(int(s) for s in group.attrs['sparse_shape'])
+        self.dtype = self.__data.dtype
+        self.chunks = None
+
+    @property
+    def shape(self):
+        return (len(self), *self.sampleShape)
+
+    @property
+    def ndim(self):
+        return len(self.sampleShape) + 1
+
+    def __len__(self):
+        return len(self.__indptr) - 1
+
+    def refresh(self):
+        # The writer appends indptr at last, so it should be refreshed at first.
+        for dset in (self.__indptr, self.__indices, self.__data):
+            dset.refresh()
+
+    def read(self, indices, sparse=False):
+        '''
+        Read the samples of a batch. Return a dense array, or a
+        tf.compat.v1.SparseTensorValue if `sparse` is on.
+        '''
+        indices = np.asarray(indices, dtype=np.int64)
+        uniq, inverse = np.unique(indices, return_inverse=True)
+        # Read the row pointers by one selection.
+        bounds = np.unique(np.concatenate([uniq, uniq + 1]))
+        ptr = self.__indptr[bounds.tolist()] if len(bounds) > 0 else np.zeros(0, dtype=np.int64)
+        starts = ptr[np.searchsorted(bounds, uniq)]
+        counts = ptr[np.searchsorted(bounds, uniq + 1)] - starts
+        cols = np.empty(int(np.sum(counts)), dtype=np.int64)
+        vals = np.empty(len(cols), dtype=self.dtype)
+        breaks = np.flatnonzero(starts[1:] - (starts[:-1] + counts[:-1]) > self.GAP) + 1
+        n = 0
+        for part in np.split(np.arange(len(uniq)), breaks):
+            if len(part) == 0:
+                continue
+            s, e = int(starts[part[0]]), int(starts[part[-1]] + counts[part[-1]])
+            if e <= s:
+                continue
+            pos = _h5_concat_ranges(starts[part] - s, counts[part])
+            cols[n:n+len(pos)] = self.__indices[s:e][pos]
+            vals[n:n+len(pos)] = self.__data[s:e][pos]
+            n += len(pos)
+        # Map the rows of the unique samples into the batch.
+        elemStarts = np.cumsum(counts) - counts
+        bcounts = counts[inverse]
+        elems = _h5_concat_ranges(elemStarts[inverse], bcounts)
+        rows = np.repeat(np.arange(len(indices), dtype=np.int64), bcounts)
+        cols, vals = cols[elems], vals[elems]
+        if sparse:
+            positions = np.unravel_index(cols, self.sampleShape) if len(self.sampleShape) > 1 else (cols,)
+            return tf.compat.v1.SparseTensorValue(indices=np.stack([rows, *positions], axis=1), values=vals,
+                                                  dense_shape=(len(indices), *self.sampleShape))
+        res = np.zeros((len(indices), int(np.prod(self.sampleShape, dtype=np.int64))), dtype=self.dtype)
+        res[rows, cols] = vals
+        return res.reshape((len(indices), *self.sampleShape))
+
+def _h5_read_sorted(dset, indices):
+    '''
+    Read the samples of a batch from a dataset by one selection. HDF5 only
+    accepts increasing indices, so the indices would be sorted (and made
+    unique) before reading, and the results would be scattered back to the
+    original order.
+    '''
+    indices = np.asarray(indices)
+    uniq, inverse = np.unique(indices, return_inverse=True)
+    data = dset[uniq.tolist()] if len(uniq) > 0 else np.empty((0, *dset.shape[1:]), dtype=dset.dtype)
+    if len(uniq) == len(indices) and np.all(inverse == np.arange(len(indices))):
+        return data
+    return data[inverse]
+
+def _h5_normalize_selection(shape, selection, name):
+    '''
+    Normalize the read selection of a dataset. The selection could be a
+    sequence with one item for each axis after the sample axis, or a dict
+    mapping the axes to the items. Each item could be None (select all),
+    a slice, an int, or a list of indices. The returned selection has one
+    item for each non-sample axis, where the int items are converted into
+    index arrays so that the axes would be kept. `shape` and `name` are
+    the shape and the name of the selected dataset.
+    '''
+    ndim = len(shape)
+    items = [slice(None)] * (ndim - 1)
+    if isinstance(selection, dict):
+        pairs = selection.items()
+    else:
+        pairs = zip(range(1, ndim), selection)
+        if len(selection) > ndim - 1:
+            raise ValueError('The selection has {0} items, but the dataset "{1}" only has {2} non-sample axes.'.format(len(selection), name, ndim - 1))
+    for axis, item in pairs:
+        axis = axis % ndim
+        if axis == 0:
+            raise ValueError('The sample axis could not be selected.')
+        if item is None:
+            item = slice(None)
+        elif not isinstance(item, slice):
+            size = shape[axis]
+            item = np.atleast_1d(np.asarray(item, dtype=np.int64))
+            item = np.where(item < 0, item + size, item)
+            if np.any(item < 0) or np.any(item >= size):
+                raise IndexError('The selected indices are out of the range of the axis {0} of the dataset "{1}".'.format(axis, name))
+        else:
+            start, stop, step = item.indices(shape[axis])
+            if step < 1:
+                raise ValueError('The slices of the selection should have positive steps.')
+        items[axis - 1] = item
+    return tuple(items)
+
+def _h5_select_array(data, selection):
+    '''
+    Apply a normalized selection to an array in the memory. The axes of
+    size 1 would be skipped, so the selection could also be applied to
+    the broadcastable arrays like the normalization factors.
+    '''
+    for axis, item in enumerate(selection, 1):
+        if data.shape[axis] == 1:
+            continue
+        if isinstance(item, slice):
+            if item != slice(None):
+                data = data[(slice(None),) * axis + (item,)]
+        else:
+            data = np.take(data, item, axis=axis)
+    return data
+
+def _h5_index_groups(indices, chunk=None):
+    '''
+    Split the index array of an axis into the groups which could be read
+    by one hyperslab each. The sorted indices would be grouped when they
+    are contiguous or lying in the same chunk (so the chunk would be read
+    only once). Return the list of (start, stop, sorted indices) and the
+    inverse order of the indices.
+    '''
+    uniq, inverse = np.unique(indices, return_inverse=True)
+    if chunk is None:
+        breaks = np.diff(uniq) > 1
+    else:
+        breaks = (np.diff(uniq) > 1) & (np.diff(uniq // chunk) > 0)
+    groups = []
+    for part in np.split(uniq, np.flatnonzero(breaks) + 1):
+        groups.append((int(part[0]), int(part[-1]) + 1, part))
+    return groups, inverse
+
+def _h5_read_selected(dset, indices, selection):
+    '''
+    Read the samples of a batch with a normalized selection. The slices
+    are applied as the hyperslab selections. The first axis selected by
+    an index list is read group by group (see _h5_index_groups), so the
+    chunks of the unused indices would not be fetched. The other index
+    lists are read by their bounding slices and picked in the memory.
+    '''
+    indices = np.asarray(indices)
+    uniq, inverse = np.unique(indices, return_inverse=True)
+    lists = [i for i, item in enumerate(selection) if not isinstance(item, slice)]
+    hslab = list(selection)
+    post = [slice(None)] * len(selection)
+    for i in lists[1:]:
+        item = selection[i]
+        hslab[i] = slice(int(np.amin(item)), int(np.amax(item)) + 1)
+        post[i] = item - hslab[i].start
+    if len(uniq) == 0:
+        shape = tuple(len(range(*item.indices(dset.shape[i+1]))) if isinstance(item, slice) else len(item) for i, item in enumerate(selection))
+        return np.empty((0, *shape), dtype=dset.dtype)
+    if not lists:
+        data = dset[(uniq.tolist(), *hslab)]
+    else:
+        axis = lists[0]
+        groups, order = _h5_index_groups(selection[axis], dset.chunks[axis + 1] if dset.chunks is not None else None)
+        parts = []
+        for start, stop, part in groups:
+            hslab[axis] = slice(start, stop)
+            block = dset[(uniq.tolist(), *hslab)]
+            if stop - start != len(part):
+                block = np.take(block, part - start, axis=axis + 1)
+            parts.append(block)
+        data = parts[0] if len(parts) == 1 else np.concatenate(parts, axis=axis + 1)
+        if np.any(order != np.arange(len(order))):
+            data = np.take(data, order, axis=axis + 1)
+        data = _h5_select_array(data, post)
+    if len(uniq) == len(indices) and np.all(inverse == np.arange(len(indices))):
+        return data
+    return data[inverse]
+
+class _H5LocalCache:
+    '''Local decompressed cache of a parser
+    The cache is a folder containing one uncompressed, contiguous .npy
+    file (memory-mappable) for each cached keyword, a mask recording the
+    cached samples, and a manifest. When a sample is read for the first
+    time, it would be read from the source file and written into the
+    cache; later it would be read from the memory-mapped cache directly.
+    The cache is validated by the size and the modification time of the
+    source file. Any mismatch would cause the cache to be rebuilt.
+    The mask is kept in the memory, and saved only after the cached data
+    are flushed, so a crash could not mark the unwritten samples as cached.
+    Several parsers (e.g. the two parsers of H5VGParser) could share one
+    cache folder, because the saved mask is merged with the current one.
+    '''
+    def __init__(self, folder, fileName, dsets, maxBytes=None):
+        '''
+        Arguments:
+            folder:   the cache folder (should be on the local disk).
+            fileName: the path of the source file.
+            dsets:    the dataset handles (one for each keyword).
+            maxBytes: the maximal bytes of the cache. The keywords would be
+                      cached in order until reaching this limit, and the
+                      other keywords would be always read from the source.
+        '''
+        self.folder = folder
+        stat = os.stat(fileName)
+        manifest = {
+            'source': os.path.realpath(fileName),
+            'source_size': stat.st_size,
+            'source_mtime': stat.st_mtime_ns,
+            'datasets': [[dset.name, list(dset.shape), dset.dtype.str] for dset in dsets]
+        }
+        self.__cached = []
+        total = 0
+        for dset in dsets:
+            nbytes = int(np.prod(dset.shape, dtype=np.int64)) * dset.dtype.itemsize
+            if dset.dtype.kind not in 'biufc' or (maxBytes is not None and total + nbytes > maxBytes):
+                self.__cached.append(False)
+            else:
+                self.__cached.append(True)
+                total += nbytes
+        if not any(self.__cached):
+            logging.warning('The local cache is disabled, because no dataset could be fit into {0} bytes.'.format(maxBytes))
+        manifest['cached'] = self.__cached
+        mfile = os.path.join(folder, 'manifest.json')
+        valid = False
+        if os.path.isfile(mfile):
+            with open(mfile, 'r') as f:
+                valid = (json.load(f) == manifest)
+        if not valid:
+            os.makedirs(folder, exist_ok=True)
+            if os.path.isfile(mfile):
+                os.remove(mfile)
+        self.__data = []
+        for i, (dset, cached) in enumerate(zip(dsets, self.__cached)):
+            if not cached:
+                self.__data.append(None)
+                continue
+            path = os.path.join(folder, '{0}.npy'.format(i))
+            if valid:
+                self.__data.append(np.lib.format.open_memmap(path, mode='r+'))
+            else:
+                self.__data.append(np.lib.format.open_memmap(path, mode='w+', dtype=dset.dtype, shape=dset.shape))
+        self.__mpath = os.path.join(folder, 'filled.npy')
+        if valid:
+            self.__filled = np.load(self.__mpath)
+        else:
+            self.__filled = np.zeros((len(dsets), len(dsets[0])), dtype=np.bool_)
+            self.__save_mask(self.__filled)
+            with open(mfile, 'w') as f:
+                json.dump(manifest, f)
+
+    def __save_mask(self, filled):
+        '''
+        Save the mask by replacing the file, so the saved mask is always
+        complete.
+        '''
+        tmp = '{0}.{1}.tmp'.format(self.__mpath, os.getpid())
+        with open(tmp, 'wb') as f:
+            np.save(f, filled)
+        os.replace(tmp, self.__mpath)
+
+    def cached(self, j):
+        '''
+        Check whether the keyword `j` is cached.
+        '''
+        return self.__cached[j]
+
+    def read(self, j, indices, dset):
+        '''
+        Read the samples of the keyword `j`. The missed samples would be read
+        from `dset` and written into the cache.
+        '''
+        indices = np.asarray(indices)
+        data = self.__data[j]
+        hit = self.__filled[j, indices]
+        if np.all(hit):
+            return data[indices]
+        res = np.empty((len(indices), *data.shape[1:]), dtype=data.dtype)
+        if np.any(hit):
+            res[hit] = data[indices[hit]]
+        miss = np.logical_not(hit)
+        res[miss] = _h5_read_sorted(dset, indices[miss])
+        data[indices[miss]] = res[miss]
+        self.__filled[j, indices[miss]] = True
+        return res
+
+    def flush(self):
+        '''
+        Flush the cached data, then save the mask. The mask is merged with the
+        saved one, which may be written by another parser sharing the folder.
+        '''
+        for data in self.__data:
+            if data is not None:
+                data.flush()
+        if os.path.isfile(self.__mpath):
+            saved = np.load(self.__mpath)
+            if saved.shape == self.__filled.shape:
+                self.__filled = np.logical_or(self.__filled, saved)
+        self.__save_mask(self.__filled)
+
+def _h5_code_token(code):
+    '''
+    Get a token of a code object from its byte code, constants and names.
+    The nested code objects (e.g. lambdas) are tokenized recursively, since
+    their repr contains the address.
+    '''
+    consts = [_h5_code_token(c) if isinstance(c, types.CodeType) else repr(c) for c in code.co_consts]
+    return '{0}({1}){2}'.format(code.co_code.hex(), ','.join(consts), repr(code.co_names))
+
+def _h5_value_token(value, depth=0):
+    '''
+    Get a token of a value captured by a function (a closure cell, a default
+    argument, an argument of a partial or the state of a callable object).
+    Return None if the value could not be identified stably.
+    '''
+    if depth > 8:
+        return None
+    if value is None or isinstance(value, (bool, int, float, complex, str, bytes)):
+        return repr(value)
+    if isinstance(value, np.generic):
+        return '{0}({1!r})'.format(value.dtype.str, value.item())
+    if isinstance(value, np.ndarray):
+        if value.dtype.hasobject:
+            return None
+        return 'ndarray({0},{1},{2})'.format(value.dtype.str, value.shape, hashlib.sha1(np.ascontiguousarray(value).tobytes()).hexdigest())
+    if isinstance(value, (tuple, list, set, frozenset)):
+        items = [_h5_value_token(v, depth + 1) for v in value]
+        if any(t is None for t in items):
+            return None
+        if isinstance(value, (set, frozenset)):
+            items = sorted(items)
+        return '{0}({1})'.format(type(value).__name__, ','.join(items))
+    if isinstance(value, dict):
+        items = [(_h5_value_token(k, depth + 1), _h5_value_token(v, depth + 1)) for k, v in value.items()]
+        if any(k is None or v is None for k, v in items):
+            return None
+        return 'dict({0})'.format(','.join(sorted('{0}:{1}'.format(k, v) for k, v in items)))
+    if isinstance(value, types.ModuleType):
+        return 'module({0})'.format(value.__name__)
+    if callable(value):
+        return _h5_func_token(value, depth + 1)
+    if hasattr(value, '__dict__') and not hasattr(value, '__slots__'):
+        state = _h5_value_token(vars(value), depth + 1)
+        return None if state is None else '{0}.{1}{2}'.format(type(value).__module__, type(value).__qualname__, state)
+    return None
+
+def _h5_func_token(func, depth=0):
+    '''
+    Get a token of a function for identifying its outputs. The token is
+    computed from the name and the byte code of the function, together with
+    the captured values, i.e. the closure cells, the default arguments, the
+    arguments of functools.partial and the state of a callable object.
+    Return None if a captured value could not be identified stably.
+    '''
+    if depth > 8:
+        return None
+    if isinstance(func, functools.partial):
+        parts = [_h5_func_token(func.func, depth + 1), _h5_value_token(func.args, depth + 1), _h5_value_token(func.keywords, depth + 1)]
+        return None if None in parts else 'partial({0})'.format(','.join(parts))
+    if isinstance(func, types.MethodType):
+        parts = [_h5_func_token(func.__func__, depth + 1), _h5_value_token(func.__self__, depth + 1)]
+        return None if None in parts else 'method({0})'.format(','.join(parts))
+    name = '{0}.{1}'.format(getattr(func, '__module__', ''), getattr(func, '__qualname__', type(func).__qualname__))
+    if isinstance(func, (type, types.BuiltinFunctionType, np.ufunc)):
+        return name
+    code = getattr(func, '__code__', None)
+    if code is None: # A callable object.
+        code = getattr(getattr(type(func), '__call__', None), '__code__', None)
+        state = _h5_value_token(vars(func), depth + 1) if hasattr(func, '__dict__') else None
+        if code is None or state is None:
+            return None
+        return '{0}{1}{2}'.format(name, _h5_code_token(code), state)
+    cells = []
+    for cell in (getattr(func, '__closure__', None) or ()):
+        try:
+            cells.append(cell.cell_contents)
+        except ValueError: # An empty cell.
+            cells.append(None)
+    parts = [_h5_value_token(v, depth + 1) for v in (tuple(cells), getattr(func, '__defaults__', None), getattr(func, '__kwdefaults__', None))]
+    if None in parts:
+        return None
+    return '{0}{1}{2}'.format(name, _h5_code_token(code), ','.join(parts))
+
+class _H5FolderLock:
+    '''Re-entrant lock of a store folder
+    The threads of this process are serialized by a thread lock shared by
+    all instances locking the same folder, and the processes are serialized
+    by `fcntl.flock` on a lock file in the folder (if available).
+    '''
+    __threadLocks = dict()
+    __registryLock = threading.Lock()
+
+    def __init__(self, folder):
+        path = os.path.realpath(folder)
+        with _H5FolderLock.__registryLock:
+            self.__lock = _H5FolderLock.__threadLocks.setdefault(path, threading.RLock())
+        self.path = os.path.join(path, 'lock')
+        self.__file = None
+        self.__depth = 0
+
+    def __enter__(self):
+        self.__lock.acquire()
+        if self.__depth == 0 and fcntl is not None:
+            if self.__file is None:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                self.__file = open(self.path, 'a')
+            fcntl.flock(self.__file, fcntl.LOCK_EX)
+        self.__depth += 1
+        return self
+
+    def __exit__(self, *args):
+        self.__depth -= 1
+        if self.__depth == 0 and self.__file is not None:
+            fcntl.flock(self.__file, fcntl.LOCK_UN)
+        self.__lock.release()
+
+class _H5MemoStore:
+    '''Persistent memoization store of a parser
+    The store keeps the per-sample outputs of a deterministic function in
+    memory-mapped .npy files with a fixed number of slots. The mapping
+    between the samples and the slots, and the last used tick of each
+    slot, are also memory-mapped, so the store could be reused by another
+    process later. When all slots are occupied, the least recently used
+    slots would be evicted.
+    The store is identified by a key, and its folder is named by the hash
+    of the key, so the changes of the file or the function would not
+    share the outdated outputs.
+    The parsers with the same key (e.g. the two parsers of H5VGParser, or
+    the parsers in other processes) share the store. The existing store is
+    always reopened instead of being recreated, and the accesses are
+    serialized by a folder lock. The function is computed outside the lock.
+    '''
+    def __init__(self, folder, key, size, maxBytes=None):
+        '''
+        Arguments:
+            folder:   the root folder of the stores.
+            key:      a string identifying the file, the keywords and the
+                      function.
+            size:     the number of samples in the file.
+            maxBytes: the maximal bytes of the stored outputs.
+        '''
+        self.folder = os.path.join(folder, hashlib.sha1(key.encode('utf-8')).hexdigest()[:16])
+        self.size = size
+        self.maxBytes = maxBytes
+        self.__outputs = None
+        self.__lock = _H5FolderLock(self.folder)
+        with self.__lock:
+            self.__reopen(key)
+
+    def __reopen(self, key):
+        '''
+        Open the store if it has been created (maybe by another parser).
+        Should be called with the lock.
+        '''
+        if self.__outputs is not None:
+            return
+        mfile = os.path.join(self.folder, 'manifest.json')
+        if os.path.isfile(mfile):
+            with open(mfile, 'r') as f:
+                manifest = json.load(f)
+            if manifest['key'] == key and manifest['size'] == self.size:
+                self.__open(manifest)
+
+    def __open(self, manifest):
+        '''
+        Open the memory-mapped files of an existed store.
+        '''
+        self.__outputs = [np.lib.format.open_memmap(os.path.join(self.folder, 'out{0}.npy'.format(i)), mode='r+') for i in range(manifest['outputs'])]
+        self.__slots = np.lib.format.open_memmap(os.path.join(self.folder, 'slots.npy'), mode='r+')
+        self.__owners = np.lib.format.open_memmap(os.path.join(self.folder, 'owners.npy'), mode='r+')
+        self.__ticks = np.lib.format.open_memmap(os.path.join(self.folder, 'ticks.npy'), mode='r+')
+        self.__tick = int(np.amax(self.__ticks)) + 1
+
+    def __create(self, key, outputs):
+        '''
+        Create a new store from the first computed outputs.
+        Should be called with the lock.
+        '''
+        os.makedirs(self.folder, exist_ok=True)
+        mfile = os.path.join(self.folder, 'manifest.json')
+        if os.path.isfile(mfile):
+            os.remove(mfile)
+        smpBytes = sum(int(np.prod(out.shape[1:], dtype=np.int64)) * out.dtype.itemsize for out in outputs)
+        capacity = self.size
+        if self.maxBytes is not None:
+            capacity = int(max(min(capacity, self.maxBytes // max(smpBytes, 1)), 1))
+        self.__outputs = [np.lib.format.open_memmap(os.path.join(self.folder, 'out{0}.npy'.format(i)), mode='w+', dtype=out.dtype, shape=(capacity, *out.shape[1:])) for i, out in enumerate(outputs)]
+        self.__slots = np.lib.format.open_memmap(os.path.join(self.folder, 'slots.npy'), mode='w+', dtype=np.int64, shape=(self.size,))
+        self.__owners = np.lib.format.open_memmap(os.path.join(self.folder, 'owners.npy'), mode='w+', dtype=np.int64, shape=(capacity,))
+        self.__ticks = np.lib.format.open_memmap(os.path.join(self.folder, 'ticks.npy'), mode='w+', dtype=np.int64, shape=(capacity,))
+        self.__slots[:] = -1
+        self.__owners[:] = -1
+        self.__tick = 1
+        with open(mfile, 'w') as f:
+            json.dump({'key': key, 'size': self.size, 'outputs': len(outputs)}, f)
+
+    def __allocate(self, num, used):
+        '''
+        Allocate `num` slots, the free slots would be used first, then the
+        least recently used slots (except `used`) would be evicted.
+        '''
+        ticks = np.array(self.__ticks)
+        ticks[used] = np.iinfo(np.int64).max
+        ticks[self.__owners < 0] = -1
+        num = min(num, len(ticks) - len(used))
+        slots = np.argpartition(ticks, num - 1)[:num] if num > 0 else np.zeros((0,), dtype=np.int64)
+        evicted = self.__owners[slots]
+        self.__slots[evicted[evicted >= 0]] = -1
+        return slots
+
+    def read(self, key, indices, compute):
+        '''
+        Read the outputs of the samples `indices`. The missed samples would
+        be computed by `compute(indices)` and stored.
+        '''
+        indices = np.asarray(indices)
+        res = None
+        miss = np.arange(len(indices))
+        with self.__lock:
+            self.__reopen(key)
+            if self.__outputs is not None:
+                slots = self.__slots[indices]
+                hit = slots >= 0
+                miss = np.flatnonzero(np.logical_not(hit))
+                res = [np.empty((len(indices), *out.shape[1:]), dtype=out.dtype) for out in self.__outputs]
+                if np.any(hit):
+                    self.__ticks[slots[hit]] = self.__tick
+                    for r, out in zip(res, self.__outputs):
+                        r[hit] = out[slots[hit]]
+                if len(miss) == 0:
+                    self.__tick += 1
+                    return res
+        computed = compute(indices[miss])
+        if res is None:
+            res = computed
+        else:
+            for r, c in zip(res, computed):
+                r[miss] = c
+        # Store the computed outputs.
+        with self.__lock:
+            self.__reopen(key)
+            if self.__outputs is None:
+                self.__create(key, computed)
+            missInd, first = np.unique(indices[miss], return_index=True)
+            stored = self.__slots[missInd] >= 0 # Stored by another parser during computing.
+            missInd, first = missInd[~stored], first[~stored]
+            used = self.__slots[indices]
+            slots = self.__allocate(len(missInd), used[used >= 0])
+            missInd, first = missInd[:len(slots)], first[:len(slots)]
+            for out, c in zip(self.__outputs, computed):
+                out[slots] = c[first]
+            self.__owners[slots] = missInd
+            self.__slots[missInd] = slots
+            self.__ticks[slots] = self.__tick
+            self.__tick += 1
+        return res
+
+    def flush(self):
+        with self.__lock:
+            if self.__outputs is not None:
+                for out in self.__outputs:
+                    out.flush()
+                for data in (self.__slots, self.__owners, self.__ticks):
+                    data.flush()
+
+class _H5Preload:
+    '''In-memory copy of the datasets of a parser
+    With the 'raw' mode, each dataset is loaded into one contiguous array,
+    and the batches are taken by numpy indexing. With the 'compressed'
+    mode, the dataset is split into blocks with a fixed number of samples,
+    and each block is compressed by a fast codec (lz4 if available,
+    otherwise zlib with the fastest level). Only the blocks required by a
+    batch would be decompressed.
+    '''
+    def __init__(self, dsets, mode='raw', block=32):
+        if mode not in ('raw', 'compressed'):
+            raise ValueError('The preload mode "{0}" is not supported, should be \'raw\' or \'compressed\'.'.format(mode))
+        self.mode = mode
+        self.block = int(block)
+        self.__data = []
+        for dset in dsets:
+            if dset.dtype.kind == 'O': # The encoded blobs are kept as they are.
+                self.__data.append(dset[()])
+            elif mode == 'raw':
+                data = np.empty(dset.shape, dtype=dset.dtype)
+                step = dset.chunks[0] if dset.chunks is not None else max(len(dset), 1)
+                for s in range(0, len(dset), step):
+                    dset.read_direct(data, source_sel=np.s_[s:s+step], dest_sel=np.s_[s:s+step])
+                self.__data.append(data)
+            else:
+                blocks = [self.__compress(np.ascontiguousarray(dset[s:s+self.block])) for s in range(0, len(dset), self.block)]
+                self.__data.append((blocks, dset.shape[1:], dset.dtype))
+
+    @staticmethod
+    def __compress(data):
+        if lz4frame is not None:
+            return lz4frame.compress(data.tobytes())
+        return zlib.compress(data.tobytes(), 1)
+
+    @staticmethod
+    def __decompress(buf, shape, dtype):
+        if lz4frame is not None:
+            buf = lz4frame.decompress(buf)
+        else:
+            buf = zlib.decompress(buf)
+        return np.frombuffer(buf, dtype=dtype).reshape((-1, *shape))
+
+    def nbytes(self):
+        '''
+        The memory used by the preloaded data.
+        '''
+        nbytes = 0
+        for data in self.__data:
+            if isinstance(data, tuple):
+                nbytes += sum(len(b) for b in data[0])
+            elif data.dtype.kind == 'O':
+                nbytes += sum(len(b) for b in data)
+            else:
+                nbytes += data.nbytes
+        return nbytes
+
+    def read(self, j, indices):
+        '''
+        Read the samples of the keyword `j`.
+        '''
+        indices = np.asarray(indices, dtype=np.int64)
+        if not isinstance(self.__data[j], tuple):
+            data = self.__data[j]
+            res = np.empty((len(indices), *data.shape[1:]), dtype=data.dtype)
+            return np.take(data, indices, axis=0, out=res)
+        blocks, shape, dtype = self.__data[j]
+        res = np.empty((len(indices), *shape), dtype=dtype)
+        bind = indices // self.block
+        for b in np.unique(bind):
+            pos = np.flatnonzero(bind == b)
+            res[pos] = self.__decompress(blocks[b], shape, dtype)[indices[pos] - b * self.block]
+        return res
+
+class _FeistelPermutation:
+    '''Keyed pseudo-random permutation
+    A bijection over [0, size) computed by a balanced Feistel network on
+    the smallest domain of 4^k >= size. The values out of [0, size) are
+    mapped again (cycle-walking) until they fall into the range. Any
+    position could be mapped independently, so the permutation requires
+    O(1) memory, and reshuffling only requires a new key.
+    '''
+    ROUNDS = 4
+
+    def __init__(self, size, key=None):
+        self.size = int(size)
+        half = 1
+        while (1 << (2 * half)) < self.size:
+            half += 1
+        self.__half = np.uint64(half)
+        self.__mask = np.uint64((1 << half) - 1)
+        self.rekey(key)
+
+    def rekey(self, key=None):
+        '''
+        Set the key (an integer). If not set, draw a random key.
+        '''
+        if key is None:
+            key = np.random.randint(0, 2**31)
+        self.key = int(key)
+        rng = np.random.RandomState(key % (2**32))
+        self.__keys = rng.randint(0, 2**32, size=self.ROUNDS, dtype=np.uint64) << np.uint64(32) | rng.randint(0, 2**32, size=self.ROUNDS, dtype=np.uint64)
+
+    @staticmethod
+    def __mix(v):
+        '''
+        The round function (the finalizer of splitmix64).
+        '''
+        v = (v ^ (v >> np.uint64(30))) * np.uint64(0xbf58476d1ce4e5b9)
+        v = (v ^ (v >> np.uint64(27))) * np.uint64(0x94d049bb133111eb)
+        return v ^ (v >> np.uint64(31))
+
+    def __encrypt(self, x):
+        left, right = x >> self.__half, x & self.__mask
+        for k in self.__keys:
+            left, right = right, left ^ (self.__mix(right ^ k) & self.__mask)
+        return (left << self.__half) | right
+
+    def __call__(self, positions):
+        '''
+        Map the positions (a scalar or an array) to the permuted indices.
+        '''
+        positions = np.asarray(positions, dtype=np.uint64)
+        res = self.__encrypt(np.atleast_1d(positions).ravel())
+        out = np.flatnonzero(res >= self.size)
+        while len(out) > 0:
+            res[out] = self.__encrypt(res[out])
+            out = out[res[out] >= self.size]
+        res = res.astype(np.int64)
+        return res[0] if positions.ndim == 0 else res.reshape(positions.shape)
+
+class _H5ArrayIndices:
+    '''Shuffled indices stored in an array
+    The keyed permutations used by permuted() are cached, because they
+    have to be computed for the whole array. Only the permutations of
+    the latest keys are kept.
+    '''
+    MAX_PASSES = 2
+
+    def __init__(self, indices):
+        self.__indices = np.asarray(indices)
+        self.__passes = dict()
+        self.__lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.__indices)
+
+    def __getitem__(self, item):
+        return self.__indices[item]
+
+    def permuted(self, key, item):
         '''
-        if self.f is None:
-            raise OSError('Should not dump data before opening a file.')
-        newkw = self.__kwargs.copy()
-        newkw.update(kwargs)
-        dshape = data.shape[1:]
-        if keyword in self.f:
-            ds = self.f[keyword]
-            dsshape = ds.shape[1:]
-            if np.all(np.array(dshape, dtype=np.int) == np.array(dsshape, dtype=np.int)):
-                N = len(ds)
-                newN = data.shape[0]
-                ds.resize(N+newN, axis=0)
-                ds[N:N+newN, ...] = data
-                if self.logver > 0:
-                    print('Dump {smp} data samples into the existed dataset {ds}. The data shape is {sze} now.'.format(smp=newN, ds=keyword, sze=ds.shape))
-            else:
-                raise ValueError('The data set shape {0} does not match the input shape {1}.'.format(dsshape, dshape))
+        Get the indices permuted by the key, without changing the stored
+        indices. This method is thread-safe.
+        '''
+        with self.__lock:
+            perm = self.__passes.get(key, None)
+            if perm is None:
+                perm = self.__indices[np.random.RandomState(key % (2**32)).permutation(len(self.__indices))]
+                while len(self.__passes) >= self.MAX_PASSES:
+                    self.__passes.pop(next(iter(self.__passes)))
+                self.__passes[key] = perm
+        return perm[item]
+
+    def shuffle(self, key=None):
+        if key is None:
+            np.random.shuffle(self.__indices)
         else:
-            self.f.create_dataset(keyword, data=data, maxshape=(None, *dshape), **newkw)
-            if self.logver > 0:
-                print('Dump {0} into the file. The data shape is {1}.'.format(keyword, data.shape))
-    
-    def open(self, fileName, enableRead=False):
+            np.random.RandomState(key % (2**32)).shuffle(self.__indices)
+        self.__passes.clear()
+
+    def resize(self, size):
+        if size > len(self.__indices):
+            self.__indices = np.concatenate([self.__indices, np.arange(len(self.__indices), size, dtype=self.__indices.dtype)])
+            self.__passes.clear()
+
+class _H5FeistelIndices:
+    '''Shuffled indices computed by a keyed permutation
+    The i-th index is computed on the fly, so the memory of the indices
+    is O(1). If `base` is provided, the permuted positions would be mapped
+    into it (used by the validators).
+    '''
+    def __init__(self, size, base=None):
+        self.size = int(size)
+        self.base = base
+        self.__perm = None
+
+    def __len__(self):
+        return self.size
+
+    def __positions(self, item):
+        if isinstance(item, slice):
+            return np.arange(*item.indices(self.size), dtype=np.int64)
+        return np.asarray(item, dtype=np.int64)
+
+    def __getitem__(self, item):
+        positions = self.__positions(item)
+        if self.__perm is not None:
+            positions = self.__perm(positions)
+        if self.base is not None:
+            return self.base[positions]
+        return positions
+
+    def permuted(self, key, item):
         '''
-        The dumped file name (path), it will produce a .h5 file.
-        Arguments:
-            fileName: a path where we save the file.
-            enableRead: when set True, enable the read/write mode.
-                        This option is used when adding data to an
-                        existed file.
+        Get the indices permuted by the key, without changing the current
+        permutation. This method is thread-safe.
         '''
-        if fileName[-3:] != '.h5':
-            fileName += '.h5'
-        self.close()
-        if enableRead:
-            fmode = 'a'
+        positions = _FeistelPermutation(self.size, key)(self.__positions(item))
+        if self.base is not None:
+            return self.base[positions]
+        return positions
+
+    def shuffle(self, key=None):
+        if self.__perm is None:
+            self.__perm = _FeistelPermutation(self.size, key)
         else:
-            fmode = 'w'
-        self.f = h5py.File(fileName, fmode)
-        if self.logver > 0:
-            print('Open a new file:', fileName)
-        
-    def close(self):
-        if self.f is not None:
-            self.f.close()
-        self.f = None
-        
-class H5HGParser(tf.keras.utils.Sequence):
+            self.__perm.rekey(key)
+
+    def resize(self, size):
+        self.size = int(size)
+        if self.__perm is not None: # Keep the key, so the seeded order is kept.
+            self.__perm = _FeistelPermutation(self.size, self.__perm.key)
+
+def _h5_create_indices(size, permutation, base=None):
+    '''
+    Create the index handle of the parsers.
+    '''
+    if permutation == 'array':
+        return _H5ArrayIndices(np.arange(size, dtype=np.int64) if base is None else base)
+    elif permutation == 'feistel':
+        return _H5FeistelIndices(size, base)
+    else:
+        raise ValueError('The permutation mode "{0}" is not supported, should be \'array\' or \'feistel\'.'.format(permutation))
+
+class H5HGParser(_H5AsyncSequence, tf.keras.utils.Sequence):
     '''Homogeneously parsing .h5 file by h5py module
     This class allows users to feed one .h5 file, and convert it to 
     tf.data.Dataset. The realization could be described as:
@@ -306,33 +2657,40 @@ class H5HGParser(tf.keras.utils.Sequence):
     Note that in the file, there may be multiple datasets. This parser
     supports reading both single set and multiple sets.
     Note that all datasets in the same file should share the same shape.
+    If the file has a valid metadata index (written by H5SupSaver), the
+    datasets would be found from the index instead of the file.
     '''
-    def __init__(self, fileName, batchSize=32, shuffle=True):
+    def __init__(self, fileName, batchSize=32, shuffle=True, permutation='array'):
         '''
         Create the parser and its h5py file handle.
         Arguments:
             fileName: the data path of the file (could be without postfix).
             batchSize: number of samples in each batch.
             shuffle: if on, shuffle the data set at the end of each epoch.
+            permutation: the way of shuffling the indices. 'array' means
+                         storing and shuffling the index array. 'feistel'
+                         means computing the shuffled indices on the fly
+                         by a keyed permutation, which requires O(1) memory
+                         and is recommended for huge datasets.
         '''
         super(H5HGParser, self).__init__()
         self.f = None
         if (not os.path.isfile(fileName)) and (os.path.isfile(fileName+'.h5')):
             fileName += '.h5'
-        self.f = h5py.File(fileName, 'r')
-        self.size = self.__createSize()
-        self.shuffle = shuffle
-        if self.mutlipleMode:
-            self.__indices, self.__secInd = self.__indexDataset()
-            if shuffle:
-                self.__shuffle()
-            self.__mapfunc = self.__mapMultiple
-        else:
-            self.__indices = self.__indexDataset()
+        self.f = _H5_FILE_POOL.acquire(fileName)
+        try:
+            self.size = self.__createSize()
+            self.shuffle = shuffle
+            self.__indices = _h5_create_indices(np.sum(self.size), permutation)
             if shuffle:
                 self.__shuffle()
-            self.__mapfunc = self.__mapSingle
-        self.__batchSize = batchSize
+            if self.mutlipleMode:
+                self.__offsets = np.concatenate([[0], np.cumsum(self.size)]).astype(np.int64)
+            self.__batchSize = batchSize
+        except BaseException: # Release the shared handle, otherwise the file would be kept open.
+            _H5_FILE_POOL.release(self.f)
+            self.f = None
+            raise
     
     def __len__(self):
         '''
@@ -342,13 +2700,18 @@ class H5HGParser(tf.keras.utils.Sequence):
         
     def __getitem__(self, idx):
         batchIndices = self.__indices[idx * self.__batchSize:(idx + 1) * self.__batchSize]
-        res = []
-        for ind in batchIndices:
-            if self.mutlipleMode:
-                res.append(self.__mapMultiple(self.__secInd[ind]))
-            else:
-                res.append(self.__mapSingle(ind))
-        res = np.stack(res, axis=0)
+        if not self.mutlipleMode:
+            return _h5_read_sorted(self.__dsets, batchIndices)
+        # Group the batch by the source datasets, and read each group once.
+        secInd = self.__secIndex(batchIndices)
+        order = np.lexsort((secInd[:, 1], secInd[:, 0]))
+        secInd = secInd[order]
+        bounds = np.flatnonzero(np.diff(secInd[:, 0])) + 1
+        res = np.empty((len(batchIndices), *self.__dsets[0].shape[1:]), dtype=self.__dsets[0].dtype)
+        for pos in np.split(np.arange(len(order)), bounds):
+            if len(pos) == 0:
+                continue
+            res[order[pos]] = _h5_read_sorted(self.__dsets[secInd[pos[0], 0]], secInd[pos, 1])
         return res
             
     def on_epoch_end(self):
@@ -357,55 +2720,72 @@ class H5HGParser(tf.keras.utils.Sequence):
         '''
         if self.shuffle:
             self.__shuffle()
+
+    def close(self):
+        '''
+        Release the shared file handle.
+        '''
+        if self.f is not None:
+            _H5_FILE_POOL.release(self.f)
+            self.f = None
+
+    def __del__(self):
+        '''
+        Release the shared file handle if the parser is dropped without
+        calling close().
+        '''
+        try:
+            if getattr(self, 'f', None) is not None:
+                self.close()
+        except Exception: # pylint: disable=broad-except
+            pass # The module may have been torn down at the interpreter exit.
     
     def __createSize(self):
         '''
         Find the number of items in the dataset, only need to be run for once.
+        The dataset handles would be cached here. If the file has a valid
+        metadata index, the sizes would be read from the index, and the
+        dataset handles would be opened on demand. If the index does not
+        list any dataset in the root, fall back to walking the file.
         '''
+        index = _h5_read_index(self.f.filename)
+        if index is not None:
+            index = [d for d in index if '/' not in d[0]]
+        if index:
+            self.mutlipleMode = len(index) > 1
+            if not self.mutlipleMode:
+                self.__dnameIndex = index[0][0]
+                self.__dsets = _H5_FILE_POOL.dataset(self.f, self.__dnameIndex)
+                return index[0][1][0]
+            self.__dnameIndex = [d[0] for d in index]
+            self.__dsets = _H5LazyDatasets(self.f, self.__dnameIndex)
+            return tuple(d[1][0] for d in index)
         if len(self.f) == 1:
             self.mutlipleMode = False
             self.__dnameIndex = list(self.f.keys())[0]
-            return len(self.f[self.__dnameIndex])
+            self.__dsets = _H5_FILE_POOL.dataset(self.f, self.__dnameIndex)
+            return len(self.__dsets)
         else:
             self.mutlipleMode = True
             self.__dnameIndex = list(self.f.keys())
-            return tuple(len(self.f[fk]) for fk in self.__dnameIndex)
+            self.__dsets = [_H5_FILE_POOL.dataset(self.f, fk) for fk in self.__dnameIndex]
+            return tuple(len(dset) for dset in self.__dsets)
         
-    def __indexDataset(self):
+    def __secIndex(self, indices):
         '''
-        Create a tensorflow index dataset, only need to be run for once.
-        Should be run after __createSize
+        Map the global indices to the (dataset, sample) pairs, for multiple
+        datasets mode. Should be run after __createSize
         '''
-        if self.mutlipleMode:
-            def genOneIndex(num):
-                return np.stack((num*np.ones(self.size[num], dtype=np.int), np.arange(self.size[num], dtype=np.int)), axis=1)
-            indices = np.concatenate(list(genOneIndex(n) for n in range(len(self.size))), axis=0)
-            return np.arange(indices.shape[0], dtype=np.int), indices
-        else:
-            return np.arange(self.size, dtype=np.int)
+        dind = np.searchsorted(self.__offsets, indices, side='right') - 1
+        return np.stack((dind, indices - self.__offsets[dind]), axis=1)
             
     def __shuffle(self):
         '''
         Resort the indices randomly.
         '''
-        np.random.shuffle(self.__indices)
-    
-    def __mapMultiple(self, index):
-        '''
-        Map function, for multiple datasets mode.
-        '''
-        dname = self.__dnameIndex[index[0]]
-        numSample = index[1]
-        return self.f[dname][numSample]
-        
-    def __mapSingle(self, index):
-        '''
-        Map function, for multiple datasets mode.
-        '''
-        dname = self.__dnameIndex
-        return self.f[dname][index]
+        self.__indices.shuffle()
 
-class H5GCombiner(tf.keras.utils.Sequence):
+class H5GCombiner(_H5AsyncSequence, tf.keras.utils.Sequence):
     '''Combiner designed for H5GParser
     In some applications, we may need to use multiple H5GParser
     simultaneously, and apply different preprocessing functions
@@ -469,6 +2849,23 @@ class H5GCombiner(tf.keras.utils.Sequence):
         else:
             return tuple(collection)
     
+    async def _aget(self, loop, executor, idx):
+        '''
+        Get the batch asynchronously. Different from __getitem__, the subsets
+        would be read concurrently.
+        '''
+        indices = list(self.__indexList)
+        for i in range(self.__setSize):
+            self.__indexList[i] = (indices[i] + 1) % self.__sizeList[i]
+        collection = await asyncio.gather(*(p._aget(loop, executor, ind) for p, ind in zip(self.__parserList, indices)))
+        for i in range(self.__setSize):
+            if self.__indexList[i] == 0: # If reach the end of a subset, call on_epoch_end
+                await loop.run_in_executor(executor, self.__parserList[i].on_epoch_end)
+        if self.__preprocfunc is not None:
+            return await loop.run_in_executor(executor, lambda: self.__preprocfunc(*collection))
+        else:
+            return tuple(collection)
+
     def append(self, newparser):
         '''
         Add a new H5Parser into this combination.
@@ -481,18 +2878,29 @@ class H5GCombiner(tf.keras.utils.Sequence):
         self.__parserList.append(newparser)
         self.__setSize += 1
 
+    def close(self):
+        '''
+        Close all parsers in the combination.
+        '''
+        for parser in self.__parserList:
+            parser.close()
+
 class H5VGParser:
     '''Grouply parsing dataset for training/validating.
     This is a factory class. It accepts the same arguments of H5GParser,
     but split the dataset into a train set and a valid set.
     '''
-    def __init__(self, fileName, keywords, batchSize=32, force_epoch=None, shuffle=True, preprocfunc=None):
+    def __init__(self, fileName, keywords, batchSize=32, force_epoch=None, shuffle=True, preprocfunc=None, **kwargs):
         '''
         Initialize the H5VGParser. This parser could not be used directly, it requires users to call
         a split method and get two H5GParsers.
+        Other keyword arguments (like `normalize`) would be passed to the H5GParsers.
+        The two H5GParsers share one file handle and one chunk cache. With
+        the `preload` option, the datasets are loaded once and shared.
         '''
-        self.trainSet = H5GParser(fileName, keywords, batchSize, None, shuffle, preprocfunc, _hasValidator=True)
-        self.validSet = H5GParser(fileName, keywords, batchSize, None, shuffle, preprocfunc, _hasValidator=True)
+        self.trainSet = H5GParser(fileName, keywords, batchSize, None, shuffle, preprocfunc, _hasValidator=True, **kwargs)
+        self.validSet = H5GParser(fileName, keywords, batchSize, None, shuffle, preprocfunc, _hasValidator=True,
+                                  _preload=self.trainSet._get_preload(), **kwargs)
         self.force_epoch = force_epoch
         self.size = self.trainSet.size
         
@@ -554,7 +2962,14 @@ class H5VGParser:
         self.validSet.applyValidator(validInd)
         self.__set_force_epoch(validRate)
 
-class H5GParser(tf.keras.utils.Sequence):
+    def close(self):
+        '''
+        Close the train set and the valid set.
+        '''
+        self.trainSet.close()
+        self.validSet.close()
+
+class H5GParser(_H5AsyncSequence, tf.keras.utils.Sequence):
     '''Grouply parsing dataset
     This class allows users to feed one .h5 file, and convert it to 
     tf.keras.utils.Sequence. The realization could be described as:
@@ -569,7 +2984,11 @@ class H5GParser(tf.keras.utils.Sequence):
             index dataset.
     Certainly, you could use this parser to load a single dataset.
     '''
-    def __init__(self, fileName, keywords, batchSize=32, force_epoch=None, shuffle=True, preprocfunc=None, _hasValidator=False):
+    def __init__(self, fileName, keywords, batchSize=32, force_epoch=None, shuffle=True, preprocfunc=None, normalize=None,
+                 cache=None, cacheMaxBytes=None, permutation='array', swmr=False, dequantize=True,
+                 cachedfunc=None, memoize=None, memoizeMaxBytes=None, memoizeConfig=None, level=0,
+                 preload=None, preloadBlock=32, selection=None, seed=None, decodeWorkers=None, maskType='float32',
+                 sparseOutput=False, decodeMode='process', _hasValidator=False, _preload=None):
         '''
         Create the parser and its h5py file handle.
         Arguments:
@@ -579,16 +2998,127 @@ class H5GParser(tf.keras.utils.Sequence):
             force_epoch: force the epoch number. If set this value, the
                          actual size of the dataset would be ignored.
                          Instead, the step number of each epoch would
-                         be set as this value.
+                         be set as this value. The batches are taken
+                         from the passes over the dataset continuously,
+                         and each batch is determined by (epoch, idx,
+                         seed), so the batches could be fetched in any
+                         order and by multiple workers.
             shuffle: if on, shuffle the data set at the end of each epoch.
             preprocfunc: this function would be added to the produced data
                          so that it could serve as a pre-processing tool.
                          Note that this tool would process the batches
                          produced by the parser.
+            normalize: normalize the batches by the statistics stored by
+                       H5Statistics before applying preprocfunc. It could
+                       be 'standard' (zero mean and unit std.) or 'minmax'
+                       (scaled into [0, 1]). It could also be a dict which
+                       maps some of the keywords to the modes. The
+                       normalized batches would be float32.
+            cache: a local folder for caching the decoded samples. The
+                   samples would be written into uncompressed memory-
+                   mapped files during the first epoch, and read from the
+                   cache in the following epochs. This option is useful
+                   when the source file is compressed or on a slow disk.
+                   The parsers reading the same file and keywords (e.g.
+                   the two parsers created by H5VGParser) could share
+                   one folder. Otherwise, use different folders, because
+                   a mismatched folder would be rebuilt.
+            cacheMaxBytes: the maximal size of the cache. The keywords
+                           that could not be fit into the cache would be
+                           read from the source file.
+            permutation: the way of shuffling the indices. 'array' means
+                         storing and shuffling the index array. 'feistel'
+                         means computing the shuffled indices on the fly
+                         by a keyed permutation, which requires O(1) memory
+                         and is recommended for huge datasets.
+            swmr: if on, open the file in the single-writer/multiple-
+                  reader mode, and refresh the dataset sizes at the end
+                  of each epoch, so that the samples dumped by a
+                  H5SupSaver in the SWMR mode would be included. The
+                  parsers with validators would not be refreshed.
+            dequantize: if on, the datasets quantized by H5SupSaver would
+                        be dequantized into float32 when arranging the
+                        batches. The dequantization would be fused with
+                        the normalization. The normalized datasets are
+                        always dequantized, even if this option is off.
+            cachedfunc: a deterministic function applied to the batches
+                        before preprocfunc. Its outputs should be arrays
+                        (or a tuple of arrays) with the batch axis. This
+                        function is used for expensive but deterministic
+                        steps like resampling and feature extraction,
+                        while preprocfunc is used for random augmentations.
+            memoize: a local folder for memoizing the per-sample outputs of
+                     cachedfunc, so that cachedfunc would be computed only
+                     once for each sample. The stored outputs are identified
+                     by the file, the keywords, the byte code and the cap-
+                     tured values of cachedfunc, and memoizeConfig.
+            memoizeMaxBytes: the maximal size of the memoized outputs. The
+                             least recently used samples would be evicted.
+            memoizeConfig: a string (or a JSON serializable object)
+                           describing the configurations of cachedfunc. It
+                           should be changed when the behavior of cachedfunc
+                           is changed without changing its code or its
+                           captured values (e.g. by a global variable). It
+                           is required if the captured values could not be
+                           identified (e.g. an object without __dict__).
+            level: the pyramid level built by H5Pyramid. The keywords with
+                   the pyramids would be read from the chosen level. It
+                   could also be a dict which maps some of the keywords
+                   to the levels.
+            preload: load the datasets into the memory, then the batches
+                     would be served without reading the file. 'raw' means
+                     loading each keyword into one contiguous array.
+                     'compressed' means holding the blocks compressed by a
+                     fast codec (lz4 if installed, otherwise zlib), and
+                     only the blocks required by a batch would be decom-
+                     pressed. The compressed mode is used when the dataset
+                     is slightly larger than the memory.
+            preloadBlock: the number of samples in each compressed block.
+            selection: a dict mapping some of the keywords to the read
+                       selections, so that only a part of each sample
+                       would be read, e.g. {'X': (None, None, [0, 3, 5])}
+                       or {'X': {-1: [0, 3, 5]}} selects 3 channels. Each
+                       selection is a sequence with one item for each
+                       axis after the sample axis, or a dict mapping the
+                       axes to the items. An item could be None, a slice,
+                       an int, or a list of indices (the axis would be
+                       kept). The selections are applied as hyperslabs
+                       when reading the file, and the index lists are
+                       read by the groups of chunks, so the unused chunks
+                       would not be fetched. The normalization factors
+                       would be selected in the same way.
+            seed: the random seed of shuffling. The order of each epoch
+                  (or each pass in the force_epoch mode) is derived from
+                  it. If not set, draw a random seed.
+            decodeWorkers: the number of workers for decoding the datasets
+                           dumped by H5SupSaver.dump_encoded. If not set,
+                           decode the batches in the calling thread. The
+                           selections of the encoded datasets are applied
+                           after decoding.
+            decodeMode: the kind of the decoding workers. 'process' means a
+                        pool of spawned processes, where the codecs used by
+                        the parser are registered again (so they should be
+                        picklable). 'thread' means a thread pool, which only
+                        speeds up the codecs releasing the GIL (e.g. 'zlib'
+                        and 'lz4' with large samples, but not 'raw' and
+                        'rle').
+            maskType: the type of the binary masks, i.e. the datasets
+                      dumped with `packbits` or the codec 'rle'. The packed
+                      bits would be unpacked for the whole batch. It could
+                      be 'float32', 'bool' or 'uint8'.
+            sparseOutput: for the sparse datasets dumped by
+                          H5SupSaver.dump_sparse, if on, return the batches
+                          as tf.compat.v1.SparseTensorValue, otherwise the
+                          batches would be densified. The sparse datasets
+                          could not be used with the local cache, the pre-
+                          loading and the selections.
         Reserved arguments:
             _hasValidator: a flag for existence of a validator, which is
                            used to a train set and a valid set simultane-
                            ously. This argument should not be used by user.
+            _preload: the preloaded datasets shared from another parser of
+                      the same file and keywords (used by H5VGParser). This
+                      argument should not be used by user.
         '''
         super(H5GParser, self).__init__()
         self.f = None
@@ -596,34 +3126,88 @@ class H5GParser(tf.keras.utils.Sequence):
             self.keywords = (keywords,)
         else:
             self.keywords = keywords
+        self.level = level
         if (not os.path.isfile(fileName)) and (os.path.isfile(fileName+'.h5')):
             fileName += '.h5'
-        self.f = h5py.File(fileName, 'r')
-        self.__dsets = self.__creatDataSets()
-        self.size = self.__createSize()
-        if not _hasValidator:
-            self.__indices = self.__indexDataset()
-        self.shuffle = shuffle
-        if shuffle and (not _hasValidator):
-            self.__shuffle()
-        self.__preprocfunc = preprocfunc
-        self.__batchSize = batchSize
-        self.__dsize = len(self.__dsets)
+        self.__swmr = swmr and (not _hasValidator)
+        if swmr:
+            if cache is not None:
+                raise ValueError('The local cache could not be used in the SWMR mode.')
+        self.f = _H5_FILE_POOL.acquire(fileName, swmr=swmr)
+        try:
+            self.__dsets = self.__creatDataSets()
+            self.size = self.__createSize()
+            self.__sparseOutput = sparseOutput
+            if any(isinstance(dset, _H5CSRDataset) for dset in self.__dsets) and (cache is not None or preload is not None):
+                raise ValueError('The sparse datasets could not be used with the local cache or the preloading.')
+            self.__selections = self.__createSelections(selection)
+            self.__codecs = [dset.attrs['codec'] if 'codec' in dset.attrs else None for dset in self.__dsets]
+            self.__packs = [int(dset.attrs['packbits_length']) if 'packbits_length' in dset.attrs else None for dset in self.__dsets]
+            self.__maskType = np.dtype(maskType)
+            if decodeMode not in ('process', 'thread'):
+                raise ValueError('The decoding mode should be \'process\' or \'thread\'.')
+            self.__decodeWorkers = decodeWorkers
+            self.__decodeMode = decodeMode
+            self.__decodePool = None
+            self.__affines = self.__createAffines(normalize, dequantize)
+            if preload is not None and (swmr or cache is not None):
+                raise ValueError('The preloading could not be used with the SWMR mode or the local cache.')
+            if preload is None:
+                self.__preload = None
+            elif _preload is not None:
+                self.__preload = _preload
+            else:
+                self.__preload = _H5Preload(self.__dsets, preload, preloadBlock)
+            self.__cache = _H5LocalCache(cache, fileName, self.__dsets, cacheMaxBytes) if cache is not None else None
+            self.__cachedfunc = cachedfunc
+            self.__memo = None
+            if memoize is not None:
+                if cachedfunc is None:
+                    raise ValueError('The memoization requires cachedfunc.')
+                if swmr:
+                    raise ValueError('The memoization could not be used in the SWMR mode.')
+                token = _h5_func_token(cachedfunc)
+                if token is None:
+                    if memoizeConfig is None:
+                        raise ValueError('The captured values of cachedfunc could not be identified, so memoizeConfig should be specified to identify the memoized outputs.')
+                    token = '{0}.{1}'.format(getattr(cachedfunc, '__module__', ''), getattr(cachedfunc, '__qualname__', type(cachedfunc).__qualname__))
+                stat = os.stat(fileName)
+                self.__memoKey = json.dumps([os.path.realpath(fileName), stat.st_size, stat.st_mtime_ns, list(self.keywords),
+                                             normalize, dequantize, level, self.__selections, token, memoizeConfig],
+                                            default=lambda o: o.tolist() if isinstance(o, np.ndarray) else str(o))
+                self.__memo = _H5MemoStore(memoize, self.__memoKey, self.size, memoizeMaxBytes)
+            self.__permutation = permutation
+            self.seed = int(seed) if seed is not None else np.random.randint(0, 2**31)
+            self.__epoch = 0
+            if not _hasValidator:
+                self.__indices = self.__indexDataset()
+            self.shuffle = shuffle
+            if shuffle and (not _hasValidator):
+                self.__shuffle()
+            self.__preprocfunc = preprocfunc
+            self.__batchSize = batchSize
+            self.__dsize = len(self.__dsets)
         
-        # Calculate the actual steps according to the dataset sizes.
-        self.__epoch_size = np.ceil(np.sum(self.size)/self.__batchSize).astype(np.int)
-        # For the epoch size if need.
-        self.__is_idx_fc = False
-        self.__fc_idx = 0
-        self.__fc_size = None
-        self.set_force_epoch(force_epoch)
+            # Calculate the actual steps according to the dataset sizes.
+            self.__epoch_size = np.ceil(np.sum(self.size)/self.__batchSize).astype(np.int)
+            # For the epoch size if need.
+            self.__is_idx_fc = False
+            self.__fc_size = None
+            self.set_force_epoch(force_epoch)
+            # The access statistics: (batches, samples, contiguous batches).
+            self.__access = [0, 0, 0]
+            self.__accessLock = threading.Lock()
+        except BaseException: # Release the shared handle, otherwise the file would be kept open.
+            _H5_FILE_POOL.release(self.f)
+            self.f = None
+            raise
     
     def applyValidator(self, validIndices):
         '''
         Apply a validator. This method accept indices produced by a validator
         and apply them to self. This method should not be called by user.
         '''
-        self.__indices = validIndices
+        self.__indices = _h5_create_indices(len(validIndices), self.__permutation, base=np.asarray(validIndices))
         self.size = len(validIndices)
         self.__epoch_size = np.ceil(np.sum(self.size)/self.__batchSize).astype(np.int)
         if self.shuffle:
@@ -631,7 +3215,7 @@ class H5GParser(tf.keras.utils.Sequence):
             
     def set_force_epoch(self, force_epoch=None):
         self.__is_idx_fc = bool(force_epoch)
-        self.__fc_idx = 0
+        self.__epoch = 0
         if not self.__is_idx_fc:
             self.__fc_size = None
         else:
@@ -647,41 +3231,202 @@ class H5GParser(tf.keras.utils.Sequence):
             return self.__epoch_size
         
     def __getitem__(self, idx):
-        # Reset idx if set force.
+        # Map idx into the pass over the dataset if set force.
         if self.__is_idx_fc:
-            idx = self.__fc_idx
-            batchIndices = self.__indices[idx * self.__batchSize:(idx + 1) * self.__batchSize]
-            # Set the cur idx of the forced mode.
-            idx += 1
-            if idx < self.__epoch_size:
-                self.__fc_idx = idx
-            else: # Detect shuffle event.
-                self.__fc_idx = 0
-                if self.shuffle:
-                    self.__shuffle()
+            npass, idx = divmod(self.__epoch * self.__fc_size + int(idx), self.__epoch_size)
+            batchSlice = slice(idx * self.__batchSize, (idx + 1) * self.__batchSize)
+            if self.shuffle and npass > 0:
+                batchIndices = self.__indices.permuted(self.__passKey(npass), batchSlice)
+            else:
+                batchIndices = self.__indices[batchSlice]
         else:
             batchIndices = self.__indices[idx * self.__batchSize:(idx + 1) * self.__batchSize]
+        self.__recordAccess(batchIndices)
         # Arrange batch.
-        res = []
-        for j in range(self.__dsize):
-            res.append([])
-        for ind in batchIndices:
-            smp = self.__mapSingle(ind)
-            for j in range(self.__dsize):
-                res[j].append(smp[j])
-        for j in range(self.__dsize):
-            res[j] = np.stack(res[j], axis=0)
+        if self.__memo is not None:
+            res = self.__memo.read(self.__memoKey, batchIndices, self.__arrangeCached)
+        elif self.__cachedfunc is not None:
+            res = self.__arrangeCached(batchIndices)
+        else:
+            res = self.__arrangeBatch(batchIndices)
         if self.__preprocfunc is not None:
             return self.__preprocfunc(*res)
         else:
             return tuple(res)
+
+    def __recordAccess(self, batchIndices):
+        '''
+        Record the access statistics of a batch.
+        '''
+        uniq = np.unique(batchIndices)
+        contiguous = int(len(uniq) > 0 and uniq[-1] - uniq[0] + 1 == len(uniq))
+        with self.__accessLock:
+            self.__access[0] += 1
+            self.__access[1] += len(batchIndices)
+            self.__access[2] += contiguous
+
+    def access_stats(self):
+        '''
+        Get the access statistics recorded since the parser is created,
+        including the number of batches, samples, the batches of contiguous
+        samples, and the read selections of the datasets. The statistics
+        could be dumped as JSON, and used by H5Repacker to choose the chunk
+        shapes for this access pattern.
+        '''
+        def dumpItem(item):
+            if isinstance(item, slice):
+                return None if item == slice(None) else ['slice', item.start, item.stop, item.step]
+            return item.tolist()
+        with self.__accessLock:
+            batches, samples, contiguous = self.__access
+        return {
+            'keywords': [dset.name.lstrip('/') for dset in self.__dsets],
+            'batches': batches,
+            'samples': samples,
+            'contiguous': contiguous,
+            'selections': [None if sel is None else [dumpItem(item) for item in sel] for sel in self.__selections]
+        }
+
+    def __arrangeBatch(self, batchIndices):
+        '''
+        Read the batches of all keywords, and apply the dequantization and
+        the normalization.
+        '''
+        res = []
+        for j in range(self.__dsize):
+            res.append(self.__readBatch(j, batchIndices))
+            if self.__affines[j] is not None:
+                scale, shift = self.__affines[j]
+                res[j] = res[j].astype(np.float32)
+                res[j] *= scale
+                res[j] += shift
+        return res
+
+    def __arrangeCached(self, batchIndices):
+        '''
+        Arrange the batches and apply cachedfunc.
+        '''
+        res = self.__cachedfunc(*self.__arrangeBatch(batchIndices))
+        if isinstance(res, np.ndarray):
+            return [res]
+        return [np.asarray(r) for r in res]
             
+    def refresh(self):
+        '''
+        Refresh the datasets in the SWMR mode, and include the newly dumped
+        samples. The writer may be dumping the keywords in turn, so the
+        size would be the minimal length of the datasets.
+        '''
+        if not self.__swmr:
+            return
+        for dset in self.__dsets:
+            dset.refresh()
+        newSize = min(len(dset) for dset in self.__dsets)
+        if newSize > self.size:
+            self.size = newSize
+            self.__indices.resize(newSize)
+            self.__epoch_size = np.ceil(np.sum(self.size)/self.__batchSize).astype(np.int)
+
     def on_epoch_end(self):
         '''
         Shuffle the data set according to the settings.
+        In the SWMR mode, the dataset sizes would be refreshed.
         '''
+        self.refresh()
+        self.__epoch += 1
         if self.shuffle and (not self.__is_idx_fc):
             self.__shuffle()
+        if self.__cache is not None:
+            self.__cache.flush()
+        if self.__memo is not None:
+            self.__memo.flush()
+
+    def _get_preload(self):
+        '''
+        Get the preloaded datasets, which could be shared with another parser.
+        '''
+        return self.__preload
+
+    def close(self):
+        '''
+        Release the shared file handle. The memoized outputs would be
+        flushed, and the decoding workers would be stopped.
+        '''
+        if self.__cache is not None:
+            self.__cache.flush()
+        if self.__memo is not None:
+            self.__memo.flush()
+        if self.__decodePool is not None:
+            self.__decodePool.terminate()
+            self.__decodePool = None
+        if self.f is not None:
+            _H5_FILE_POOL.release(self.f)
+            self.f = None
+
+    def __del__(self):
+        '''
+        Release the shared file handle if the parser is dropped without
+        calling close().
+        '''
+        try:
+            if getattr(self, 'f', None) is not None:
+                self.close()
+        except Exception: # pylint: disable=broad-except
+            pass # The module may have been torn down at the interpreter exit.
+
+    def __readBatch(self, j, batchIndices):
+        '''
+        Read the batch of the keyword `j` by one selection.
+        '''
+        if isinstance(self.__dsets[j], _H5CSRDataset):
+            return self.__dsets[j].read(batchIndices, self.__sparseOutput)
+        selection = self.__selections[j]
+        if self.__preload is not None:
+            data = self.__preload.read(j, batchIndices)
+        elif self.__cache is not None and self.__cache.cached(j):
+            data = self.__cache.read(j, batchIndices, self.__dsets[j])
+        elif selection is not None and self.__packs[j] is not None:
+            # The packed axis would be selected after unpacking.
+            data = _h5_read_selected(self.__dsets[j], batchIndices, (*selection[:-1], slice(None)))
+            selection = (slice(None),) * (len(selection) - 1) + selection[-1:]
+        elif selection is not None and self.__codecs[j] is None:
+            return _h5_read_selected(self.__dsets[j], batchIndices, selection)
+        else:
+            data = _h5_read_sorted(self.__dsets[j], batchIndices)
+        if self.__codecs[j] is not None:
+            data = self.__decode(j, data)
+            if self.__codecs[j] == 'rle':
+                data = data.astype(self.__maskType)
+        elif self.__packs[j] is not None:
+            data = np.unpackbits(data, axis=-1, count=self.__packs[j])
+            data = data.view(np.bool_) if self.__maskType == np.bool_ else data.astype(self.__maskType, copy=False)
+        return data if selection is None else _h5_select_array(data, selection)
+
+    def __decode(self, j, blobs):
+        '''
+        Decode the blobs of the keyword `j`. The batch would be split into
+        parts, and decoded by the worker pool if decodeWorkers is set.
+        '''
+        codec = self.__codecs[j]
+        if not self.__decodeWorkers or len(blobs) <= 1:
+            res = _h5_decode_blobs((codec, blobs))
+        else:
+            if self.__decodePool is None:
+                if self.__decodeMode == 'thread':
+                    self.__decodePool = multiprocessing.pool.ThreadPool(self.__decodeWorkers)
+                else:
+                    codecs = {name: _h5_get_codec(name) for name in set(self.__codecs) if name is not None}
+                    try:
+                        pickle.dumps(codecs)
+                    except (pickle.PicklingError, AttributeError, TypeError) as err:
+                        raise ValueError('The codecs should be picklable to be sent to the decoding processes, '
+                                         'otherwise use decodeMode=\'thread\'.') from err
+                    self.__decodePool = _h5_process_pool(self.__decodeWorkers, initializer=_h5_decode_init, initargs=(codecs,))
+            parts = np.array_split(blobs, min(self.__decodeWorkers, len(blobs)))
+            res = np.concatenate(self.__decodePool.map(_h5_decode_blobs, [(codec, part) for part in parts]), axis=0)
+        if res is None:
+            raise ValueError('Could not decode an empty batch of the keyword "{0}".'.format(self.keywords[j]))
+        return res
         
     def __creatDataSets(self):
         '''
@@ -689,17 +3434,100 @@ class H5GParser(tf.keras.utils.Sequence):
         '''
         dsets = []
         for key in self.keywords:
-            dsets.append(self.f[key])
+            level = self.level.get(key, 0) if isinstance(self.level, dict) else self.level
+            if level > 0 and level <= self.f[key].attrs.get('pyramid_levels', 0):
+                key = _h5_pyramid_name(key, level)
+            elif level > 0 and 'pyramid_levels' in self.f[key].attrs:
+                raise KeyError('The pyramid level {0} of the keyword "{1}" does not exist.'.format(level, key))
+            dset = _H5_FILE_POOL.dataset(self.f, key)
+            if isinstance(dset, h5py.Group) and dset.attrs.get('format', None) == 'csr':
+                dset = _H5CSRDataset(dset)
+            dsets.append(dset)
         if not dsets:
             raise KeyError('Keywords are not mapped to datasets in the file.')
         return dsets
         
+    def __createAffines(self, normalize, dequantize):
+        '''
+        Create the (scale, shift) pairs for dequantizing the batches and
+        normalizing the batches from the statistics stored by H5Statistics.
+        Should be run after __creatDataSets.
+        '''
+        if normalize is None:
+            normalize = dict()
+        elif isinstance(normalize, str):
+            normalize = {key: normalize for key in self.keywords}
+        affines = []
+        for key, dset in zip(self.keywords, self.__dsets):
+            attrs = dset.attrs
+            qscale, qshift = 1.0, 0.0
+            mode = normalize.get(key, None)
+            # The statistics are computed on the dequantized data, so the normalization always dequantizes.
+            if (dequantize or mode is not None) and 'quant_scale' in attrs:
+                bshape = [1] * dset.ndim
+                if 'quant_axis' in attrs:
+                    bshape[int(attrs['quant_axis'])] = -1
+                qscale = np.reshape(attrs['quant_scale'], bshape).astype(np.float32)
+                qshift = np.reshape(attrs['quant_offset'], bshape).astype(np.float32)
+            if mode is None:
+                affines.append((qscale, qshift) if dequantize and 'quant_scale' in attrs else None)
+                continue
+            if 'stats_mean' not in attrs:
+                raise KeyError('The dataset "{0}" does not have statistics, need to run H5Statistics first.'.format(key))
+            if mode == 'standard':
+                scale = 1.0 / np.maximum(attrs['stats_std'], 1e-7)
+                shift = -attrs['stats_mean'] * scale
+            elif mode == 'minmax':
+                scale = 1.0 / np.maximum(attrs['stats_max'] - attrs['stats_min'], 1e-7)
+                shift = -attrs['stats_min'] * scale
+            else:
+                raise ValueError('The normalization mode "{0}" is not supported, should be \'standard\' or \'minmax\'.'.format(mode))
+            bshape = [1] * dset.ndim
+            if 'stats_axis' in attrs:
+                bshape[int(attrs['stats_axis'])] = -1
+            scale = np.reshape(scale, bshape).astype(np.float32)
+            shift = np.reshape(shift, bshape).astype(np.float32)
+            affines.append((qscale * scale, qshift * scale + shift))
+        for j, selection in enumerate(self.__selections):
+            if selection is not None and affines[j] is not None:
+                affines[j] = tuple(_h5_select_array(a, selection) if isinstance(a, np.ndarray) else a for a in affines[j])
+        return affines
+
+    def __createSelections(self, selection):
+        '''
+        Normalize the read selections of the keywords.
+        Should be run after __creatDataSets.
+        '''
+        if selection is None:
+            selection = dict()
+        for key in selection:
+            if key not in self.keywords:
+                raise KeyError('The selected keyword "{0}" is not in the keywords.'.format(key))
+        res = []
+        for key, dset in zip(self.keywords, self.__dsets):
+            if key not in selection:
+                res.append(None)
+                continue
+            if isinstance(dset, _H5CSRDataset):
+                raise ValueError('The sparse dataset "{0}" could not be selected.'.format(key))
+            shape = dset.shape
+            if 'packbits_length' in dset.attrs:
+                shape = (*shape[:-1], int(dset.attrs['packbits_length']))
+            if 'codec' in dset.attrs: # The encoded blobs are selected after decoding.
+                if 'codec_shape' not in dset.attrs:
+                    raise ValueError('The encoded dataset "{0}" could not be selected, because its samples do not share the same shape.'.format(key))
+                shape = (len(dset), *dset.attrs['codec_shape'])
+            res.append(_h5_normalize_selection(shape, selection[key], dset.name))
+        return res
+
     def __createSize(self):
         '''
         Find the number of items in the dataset, only need to be run for once.
         Should be run after __creatDataSets.
         '''
         sze = len(self.__dsets[0])
+        if self.__swmr: # The writer may be dumping the keywords in turn.
+            return min(len(dset) for dset in self.__dsets)
         for dset in self.__dsets:
             if sze != len(dset):
                 raise TypeError('The assigned keywords do not correspond to each other.')
@@ -710,16 +3538,393 @@ class H5GParser(tf.keras.utils.Sequence):
         Create a tensorflow index dataset, only need to be run for once.
         Should be run after __createSize.
         '''
-        return np.arange(self.size, dtype=np.int)
+        return _h5_create_indices(self.size, self.__permutation)
         
+    def __passKey(self, npass):
+        '''
+        Derive the shuffling key of a pass (or an epoch) from the seed.
+        '''
+        return int(np.random.RandomState([self.seed % (2**32), npass % (2**32)]).randint(0, 2**31))
+
     def __shuffle(self):
         '''
         Resort the indices randomly.
         '''
-        np.random.shuffle(self.__indices)
+        self.__indices.shuffle(self.__passKey(self.__epoch))
+
+class H5PGParser(_H5AsyncSequence, tf.keras.utils.Sequence):
+    '''Grouply parsing random patches
+    This class is used for training networks by random patches cropped from
+    large samples (e.g. volumes). Different from H5GParser, it would not read
+    the whole samples. Instead, for each patch, only the required hyperslab
+    would be read from each keyword. The realization could be described as:
+        (1) Create .h5 file handle, and find the datasets of the keywords.
+            All datasets should share the same sample number and the same
+            sizes along the spatial axes.
+        (2) For each batch, choose the samples and the patch origins
+            randomly (uniformly, or by a weight map).
+        (3) Read the hyperslabs of the patches into a preallocated batch,
+            the patches are read in the sorted order for locality.
+    The patches of each batch are determined by (seed, epoch, idx), so the
+    batches could be fetched in any order and by multiple workers.
+    '''
+    def __init__(self, fileName, keywords, patchSize, batchSize=32, steps=100, spatialAxes=None, weightKeyword=None,
+                 alignChunks=True, preprocfunc=None, seed=None):
+        '''
+        Create the parser and its h5py file handle.
+        Arguments:
+            fileName: the data path of the file (could be without postfix).
+            keywords: should be a list of keywords (or a single keyword).
+            patchSize: the patch size along each spatial axis.
+            batchSize: number of patches in each batch.
+            steps: number of batches in each epoch.
+            spatialAxes: the spatial axes of the datasets (the sample axis is
+                         0). If not set, use (1, 2, ..., len(patchSize)).
+            weightKeyword: the keyword of a weight map with the shape of
+                           (N, *grid), where each grid cell covers a region
+                           of the spatial axes. The patch centers would be
+                           sampled from the cells with the probabilities
+                           proportional to the weights. The grid could be
+                           much coarser than the samples. If not set, the
+                           patches would be sampled uniformly.
+            alignChunks: if on, the patch origins would be aligned with the
+                         chunk layout of the first keyword along the axes
+                         where the chunk size is not larger than the patch
+                         size, so each patch would touch the least chunks.
+                         Note that this option makes the origins discrete.
+            preprocfunc: this function would be added to the produced data
+                         so that it could serve as a pre-processing tool.
+            seed: the random seed. If not set, draw a random seed.
+        '''
+        super(H5PGParser, self).__init__()
+        self.f = None
+        if isinstance(keywords, str):
+            self.keywords = (keywords,)
+        else:
+            self.keywords = tuple(keywords)
+        if (not os.path.isfile(fileName)) and (os.path.isfile(fileName+'.h5')):
+            fileName += '.h5'
+        self.f = _H5_FILE_POOL.acquire(fileName)
+        try:
+            self.__dsets = [_H5_FILE_POOL.dataset(self.f, key) for key in self.keywords]
+            if not self.__dsets:
+                raise KeyError('Keywords are not mapped to datasets in the file.')
+            self.patchSize = tuple(int(p) for p in patchSize)
+            ndim = self.__dsets[0].ndim
+            spatialAxes = tuple(range(1, len(self.patchSize) + 1)) if spatialAxes is None else tuple(spatialAxes)
+            self.spatialAxes = tuple(a % ndim for a in spatialAxes)
+            if len(self.spatialAxes) != len(self.patchSize) or 0 in self.spatialAxes:
+                raise ValueError('The spatial axes should be not the sample axis, and correspond to the patch size.')
+            self.size = len(self.__dsets[0])
+            self.__spatialShape = tuple(self.__dsets[0].shape[a] for a in self.spatialAxes)
+            for dset in self.__dsets:
+                if len(dset) != self.size or tuple(dset.shape[a] for a in self.spatialAxes) != self.__spatialShape:
+                    raise TypeError('The assigned keywords do not correspond to each other.')
+            if any(p > s for p, s in zip(self.patchSize, self.__spatialShape)):
+                raise ValueError('The patch size {0} is larger than the sample size {1}.'.format(self.patchSize, self.__spatialShape))
+            self.__align = np.ones(len(self.patchSize), dtype=np.int64)
+            chunks = self.__dsets[0].chunks
+            if alignChunks and chunks is not None:
+                for i, (a, p) in enumerate(zip(self.spatialAxes, self.patchSize)):
+                    if chunks[a] <= p:
+                        self.__align[i] = chunks[a]
+            self.__cdf = None
+            if weightKeyword is not None:
+                weights = np.asarray(self.f[weightKeyword][:], dtype=np.float64)
+                if len(weights) != self.size or weights.ndim != len(self.patchSize) + 1:
+                    raise TypeError('The weight map should have the shape of (N, *grid).')
+                self.__grid = weights.shape[1:]
+                self.__cdf = np.cumsum(weights.ravel())
+                if self.__cdf[-1] <= 0:
+                    raise ValueError('The weight map should have positive weights.')
+                self.__cdf /= self.__cdf[-1]
+            self.__batchSize = batchSize
+            self.__steps = int(steps)
+            self.__preprocfunc = preprocfunc
+            self.seed = np.random.randint(0, 2**31) if seed is None else seed
+            self.epoch = 0
+        except BaseException: # Release the shared handle, otherwise the file would be kept open.
+            _H5_FILE_POOL.release(self.f)
+            self.f = None
+            raise
+
+    def __len__(self):
+        return self.__steps
+
+    def __sample(self, rng):
+        '''
+        Sample the sample indices and the patch origins of a batch.
+        '''
+        patch = np.asarray(self.patchSize, dtype=np.int64)
+        space = np.asarray(self.__spatialShape, dtype=np.int64)
+        if self.__cdf is None:
+            smp = rng.randint(0, self.size, size=self.__batchSize)
+            origins = np.floor(rng.uniform(size=(self.__batchSize, len(patch))) * (space - patch + 1)).astype(np.int64)
+        else:
+            cells = np.searchsorted(self.__cdf, rng.uniform(size=self.__batchSize), side='right')
+            cells = np.minimum(cells, len(self.__cdf) - 1)
+            smp, *gpos = np.unravel_index(cells, (self.size, *self.__grid))
+            grid = np.asarray(self.__grid, dtype=np.float64)
+            centers = (np.stack(gpos, axis=1) + rng.uniform(size=(self.__batchSize, len(patch)))) * (space / grid)
+            origins = np.floor(centers).astype(np.int64) - patch // 2
+        origins = np.clip(origins, 0, space - patch)
+        origins -= origins % self.__align
+        return smp, origins
+
+    def __getitem__(self, idx):
+        rng = np.random.RandomState([self.seed % (2**32), self.epoch % (2**32), idx % (2**32)])
+        smp, origins = self.__sample(rng)
+        order = np.lexsort(tuple(origins[:, i] for i in reversed(range(origins.shape[1]))) + (smp,))
+        res = []
+        for dset in self.__dsets:
+            shape = list(dset.shape)
+            for a, p in zip(self.spatialAxes, self.patchSize):
+                shape[a] = p
+            shape[0] = self.__batchSize
+            batch = np.empty(shape, dtype=dset.dtype)
+            for b in order:
+                sel = [slice(None)] * dset.ndim
+                sel[0] = int(smp[b])
+                for a, o, p in zip(self.spatialAxes, origins[b], self.patchSize):
+                    sel[a] = slice(int(o), int(o) + p)
+                dset.read_direct(batch, source_sel=tuple(sel), dest_sel=np.s_[b])
+            res.append(batch)
+        if self.__preprocfunc is not None:
+            return self.__preprocfunc(*res)
+        else:
+            return tuple(res)
+
+    def on_epoch_end(self):
+        '''
+        Move to the next epoch, the patches would be sampled again.
+        '''
+        self.epoch += 1
+
+    def close(self):
+        '''
+        Release the shared file handle.
+        '''
+        if self.f is not None:
+            _H5_FILE_POOL.release(self.f)
+            self.f = None
+
+    def __del__(self):
+        '''
+        Release the shared file handle if the parser is dropped without
+        calling close().
+        '''
+        try:
+            if getattr(self, 'f', None) is not None:
+                self.close()
+        except Exception: # pylint: disable=broad-except
+            pass # The module may have been torn down at the interpreter exit.
+
+_H5_SHM_OWNED = set()
+
+def _h5_shm_attach(name):
+    '''
+    Attach an existed shared memory block without tracking it, so that the
+    block would not be unlinked when the client exits.
+    '''
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError: # For python < 3.13.
+        shm = shared_memory.SharedMemory(name=name)
+        if name in _H5_SHM_OWNED: # Created by a loader of this process.
+            return shm
+        try:
+            from multiprocessing import resource_tracker
+            resource_tracker.unregister(shm._name, 'shared_memory')
+        except Exception:
+            pass
+        return shm
+
+class H5SharedLoader:
+    '''Loading datasets into the shared memory
+    This class is used as a local loader service. It loads (and decodes)
+    the datasets of a .h5 file into the POSIX shared memory once, then
+    multiple processes on the same machine could use H5SMParser to draw
+    their own shuffled batches from the shared memory without reading the
+    file again.
+    The shared memory blocks are named by `name`. A manifest block named
+    `{name}_meta` describes the shapes, types and the quantization attri-
+    butes of the datasets, so a client only needs the name to attach the
+    data. The blocks would be released when this loader is closed, so the
+    loader should be kept alive while the clients are running, e.g.
+        with H5SharedLoader('data.h5', ['x', 'y']) as loader:
+            ... # Run the training processes.
+    Requires python 3.8+.
+    '''
+    def __init__(self, fileName, keywords, name=None, chunkSize=None):
+        '''
+        Load the datasets into the shared memory.
+        Arguments:
+            fileName:  the data path of the file (could be without postfix).
+            keywords:  should be a list of keywords (or a single keyword).
+            name:      the name of the shared memory. If not set, use the name
+                       given by default_name(fileName).
+            chunkSize: the number of samples loaded in each read. If not set,
+                       use the chunk layout of each dataset.
+        '''
+        if shared_memory is None:
+            raise ImportError('The shared memory requires python 3.8+.')
+        if (not os.path.isfile(fileName)) and (os.path.isfile(fileName+'.h5')):
+            fileName += '.h5'
+        self.keywords = (keywords,) if isinstance(keywords, str) else tuple(keywords)
+        self.name = self.default_name(fileName) if name is None else name
+        self.__blocks = []
+        manifest = {'keywords': list(self.keywords), 'datasets': []}
+        try:
+            with h5py.File(fileName, 'r') as f:
+                for i, key in enumerate(self.keywords):
+                    dset = f[key]
+                    nbytes = max(int(np.prod(dset.shape, dtype=np.int64)) * dset.dtype.itemsize, 1)
+                    shm = shared_memory.SharedMemory(name='{0}_{1}'.format(self.name, i), create=True, size=nbytes)
+                    self.__blocks.append(shm)
+                    _H5_SHM_OWNED.add(shm.name)
+                    data = np.ndarray(dset.shape, dtype=dset.dtype, buffer=shm.buf)
+                    step = chunkSize if chunkSize is not None else (dset.chunks[0] if dset.chunks is not None else max(len(dset), 1))
+                    for s in range(0, len(dset), step):
+                        dset.read_direct(data, source_sel=np.s_[s:s+step], dest_sel=np.s_[s:s+step])
+                    del data
+                    attrs = {k: np.asarray(v).tolist() for k, v in dset.attrs.items() if k.startswith('quant_')}
+                    manifest['datasets'].append({'shape': list(dset.shape), 'dtype': dset.dtype.str, 'attrs': attrs})
+            meta = json.dumps(manifest).encode('utf-8')
+            shm = shared_memory.SharedMemory(name='{0}_meta'.format(self.name), create=True, size=len(meta) + 8)
+            self.__blocks.append(shm)
+            _H5_SHM_OWNED.add(shm.name)
+            shm.buf[:8] = np.int64(len(meta)).tobytes()
+            shm.buf[8:8+len(meta)] = meta
+        except Exception:
+            self.close()
+            raise
+
+    @staticmethod
+    def default_name(fileName):
+        '''
+        Get the default shared memory name of a file.
+        '''
+        if (not os.path.isfile(fileName)) and (os.path.isfile(fileName+'.h5')):
+            fileName += '.h5'
+        return 'mdnt_' + hashlib.sha1(os.path.realpath(fileName).encode('utf-8')).hexdigest()[:12]
+
+    def close(self):
+        '''
+        Release the shared memory.
+        '''
+        for shm in self.__blocks:
+            shm.close()
+            shm.unlink()
+            _H5_SHM_OWNED.discard(shm.name)
+        self.__blocks = []
 
-    def __mapSingle(self, index):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+class H5SMParser(_H5AsyncSequence, tf.keras.utils.Sequence):
+    '''Grouply parsing dataset from the shared memory
+    This class is a client of H5SharedLoader. It has the same behavior of
+    H5GParser, but the batches are taken from the shared memory by numpy
+    indexing, so multiple processes could share one copy of the data, and
+    each process would have its own shuffling.
+    '''
+    def __init__(self, name, keywords=None, batchSize=32, shuffle=True, preprocfunc=None, permutation='array', dequantize=True):
+        '''
+        Attach the shared memory.
+        Arguments:
+            name: the name of the shared memory given by H5SharedLoader. It
+                  could also be the data path of the file, then the default
+                  name would be used.
+            keywords: should be a list of keywords (or a single keyword). If
+                      not set, use all keywords loaded by the loader.
+            batchSize: number of samples in each batch.
+            shuffle: if on, shuffle the data set at the end of each epoch.
+            preprocfunc: this function would be added to the produced data
+                         so that it could serve as a pre-processing tool.
+            permutation: the way of shuffling the indices ('array' or
+                         'feistel'), see H5GParser.
+            dequantize: if on, the quantized datasets would be dequantized
+                        into float32.
+        '''
+        super(H5SMParser, self).__init__()
+        if shared_memory is None:
+            raise ImportError('The shared memory requires python 3.8+.')
+        if os.path.isfile(name) or os.path.isfile(name+'.h5'):
+            name = H5SharedLoader.default_name(name)
+        self.__blocks = []
+        self.__data = []
+        try:
+            shm = _h5_shm_attach('{0}_meta'.format(name))
+            self.__blocks.append(shm)
+            length = int(np.frombuffer(shm.buf[:8], dtype=np.int64)[0])
+            manifest = json.loads(bytes(shm.buf[8:8+length]).decode('utf-8'))
+            if keywords is None:
+                keywords = manifest['keywords']
+            self.keywords = (keywords,) if isinstance(keywords, str) else tuple(keywords)
+            self.__affines = []
+            for key in self.keywords:
+                if key not in manifest['keywords']:
+                    raise KeyError('The keyword "{0}" is not loaded by the shared loader.'.format(key))
+                i = manifest['keywords'].index(key)
+                info = manifest['datasets'][i]
+                shm = _h5_shm_attach('{0}_{1}'.format(name, i))
+                self.__blocks.append(shm)
+                self.__data.append(np.ndarray(tuple(info['shape']), dtype=np.dtype(info['dtype']), buffer=shm.buf))
+                attrs = info['attrs']
+                if dequantize and 'quant_scale' in attrs:
+                    bshape = [1] * len(info['shape'])
+                    if 'quant_axis' in attrs:
+                        bshape[int(attrs['quant_axis'])] = -1
+                    self.__affines.append((np.reshape(attrs['quant_scale'], bshape).astype(np.float32),
+                                           np.reshape(attrs['quant_offset'], bshape).astype(np.float32)))
+                else:
+                    self.__affines.append(None)
+            self.size = len(self.__data[0])
+            if any(len(data) != self.size for data in self.__data):
+                raise TypeError('The assigned keywords do not correspond to each other.')
+            self.__indices = _h5_create_indices(self.size, permutation)
+            self.shuffle = shuffle
+            if shuffle:
+                self.__indices.shuffle()
+            self.__preprocfunc = preprocfunc
+            self.__batchSize = batchSize
+        except BaseException: # Detach the attached blocks, otherwise they would be kept until exit.
+            self.close()
+            raise
+
+    def __len__(self):
+        return np.ceil(self.size/self.__batchSize).astype(np.int64)
+
+    def __getitem__(self, idx):
+        batchIndices = self.__indices[idx * self.__batchSize:(idx + 1) * self.__batchSize]
+        res = []
+        for data, affine in zip(self.__data, self.__affines):
+            batch = np.take(data, batchIndices, axis=0)
+            if affine is not None:
+                batch = batch.astype(np.float32)
+                batch *= affine[0]
+                batch += affine[1]
+            res.append(batch)
+        if self.__preprocfunc is not None:
+            return self.__preprocfunc(*res)
+        else:
+            return tuple(res)
+
+    def on_epoch_end(self):
+        '''
+        Shuffle the data set according to the settings.
+        '''
+        if self.shuffle:
+            self.__indices.shuffle()
+
+    def close(self):
         '''
-        Map function, for multiple datasets mode.
+        Detach the shared memory.
         '''
-        return tuple(dset[index] for dset in self.__dsets)
+        self.__data = []
+        for shm in self.__blocks:
+            shm.close()
+        self.__blocks = []
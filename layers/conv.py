@@ -25,6 +25,16 @@
 # Here we also implement some tied convolutional layers, note
 # that it is necessary to set name scope if using them in multi-
 # models.
+# Version: 0.63 # 2026/10/19
+# Comments:
+#   Enable AConv to fold the batch normalization into the conv-
+#   olutional kernel and bias for inference.
+# Version: 0.62 # 2026/10/19
+# Comments:
+#   Compute the group convolution by one fused op (the block-
+#   diagonal matmul) for 1x1 kernels,
+#   the former loop could be used by setting this macro:
+#   mdnt.layers.conv.FUSED_GROUP_CONV = False
 # Version: 0.61 # 2019/6/20
 # Comments:
 #   Fix a bug for using bias when set normalization=None in 
@@ -74,6 +84,8 @@
 ################################################################
 '''
 
+import numpy as np
+
 from tensorflow.python.framework import tensor_shape
 from tensorflow.python.keras import activations
 from tensorflow.python.keras import backend as K
@@ -83,6 +95,8 @@ from tensorflow.python.keras import regularizers
 from tensorflow.python.keras.utils import conv_utils
 from tensorflow.python.keras.engine.base_layer import Layer
 from tensorflow.python.ops import array_ops
+from tensorflow.python.ops import linalg_ops
+from tensorflow.python.ops import math_ops
 from tensorflow.python.ops import nn
 from tensorflow.python.ops import nn_ops
 from tensorflow.python.ops import variables
@@ -98,6 +112,7 @@ else:
     from tensorflow.python.keras.engine.input_spec import InputSpec
 
 NEW_CONV_TRANSPOSE = True
+FUSED_GROUP_CONV = True
 
 def _get_macro_conv():
     return NEW_CONV_TRANSPOSE
@@ -593,6 +608,12 @@ class _GroupConv(Layer):
     several groups, and apply trivial convolution (or called dense convolution) to
     each group. Inside each group, the convolution is trivial, however, between each
     two groups, the convolutions are independent.
+    The groups are computed by one fused op when possible:
+        'matmul': for 1x1 kernels, the strided inputs are multiplied by the block-
+                  diagonal kernel by one matmul.
+        'loop':   otherwise, one convolution for each group, then concatenate.
+    The mode is chosen when building the layer, and the loop could be forced by
+    setting `mdnt.layers.conv.FUSED_GROUP_CONV = False`.
     Arguments:
         rank: An integer, the rank of the convolution, e.g. "2" for 2D convolution.
         lgroups: Integer, the group number of the latent convolution branch. The
@@ -737,20 +758,61 @@ class _GroupConv(Layer):
                 strides=self.strides,
                 padding=op_padding.upper(),
                 data_format=conv_utils.convert_data_format(self.data_format, self.rank + 2))
+        self._group_mode = self._select_group_mode()
         self.built = True
 
-    def call(self, inputs):
+    def _select_group_mode(self):
+        '''
+        Choose the way of computing the groups, see the docstring of the class.
+        '''
+        if (not FUSED_GROUP_CONV) or self.lgroups == 1:
+            return 'loop'
+        if all(k == 1 for k in self.kernel_size):
+            return 'matmul'
+        return 'loop'
+
+    def _group_matmul(self, inputs):
+        # A 1x1 convolution with strides is equivalent to subsampling the inputs.
+        if any(s != 1 for s in self.strides):
+            spatial = tuple(slice(None, None, s) for s in self.strides)
+            if self.data_format == 'channels_first':
+                inputs = inputs[(slice(None), slice(None)) + spatial]
+            else:
+                inputs = inputs[(slice(None),) + spatial]
+        # Expand the kernel into a block-diagonal matrix, so all groups are
+        # computed by one matmul. Although the zero blocks are multiplied,
+        # it is much faster than computing the small groups separately.
+        kernel = array_ops.reshape(self.kernel, (self.group_input_dim, self.lgroups, 1, self.lfilters))
+        kernel = array_ops.transpose(kernel, (1, 0, 2, 3))
+        mask = array_ops.reshape(linalg_ops.eye(self.lgroups, dtype=kernel.dtype), (self.lgroups, 1, self.lgroups, 1))
+        kernel = array_ops.reshape(kernel * mask, (self.lgroups * self.group_input_dim, self.lgroups * self.lfilters))
+        if self.data_format == 'channels_first':
+            # Move the channels to the last axis, since einsum with ellipses
+            # is not supported by the early versions.
+            inputs = array_ops.transpose(inputs, (0, *range(2, self.rank + 2), 1))
+            outputs = math_ops.tensordot(inputs, kernel, [[self.rank + 1], [0]])
+            return array_ops.transpose(outputs, (0, self.rank + 1, *range(1, self.rank + 1)))
+        else:
+            return math_ops.tensordot(inputs, kernel, [[self.rank + 1], [0]])
+
+    def _group_loop(self, inputs):
         outputs_list = []
         if self.data_format == 'channels_first':
             for i in range(self.lgroups):
                 get_output = self._convolution_op(inputs[:,i*self.group_input_dim:(i+1)*self.group_input_dim, ...], self.kernel[..., i*self.lfilters:(i+1)*self.lfilters])
                 outputs_list.append(get_output)
-            outputs = array_ops.concat(outputs_list, 1)
+            return array_ops.concat(outputs_list, 1)
         else:
             for i in range(self.lgroups):
                 get_output = self._convolution_op(inputs[..., i*self.group_input_dim:(i+1)*self.group_input_dim], self.kernel[..., i*self.lfilters:(i+1)*self.lfilters])
                 outputs_list.append(get_output)
-            outputs = array_ops.concat(outputs_list, -1)
+            return array_ops.concat(outputs_list, -1)
+
+    def call(self, inputs):
+        if self._group_mode == 'matmul':
+            outputs = self._group_matmul(inputs)
+        else:
+            outputs = self._group_loop(inputs)
 
         if self.use_bias:
             if self.data_format == 'channels_first':
@@ -1171,6 +1233,85 @@ class GroupConv3D(_GroupConv):
             bias_constraint=constraints.get(bias_constraint),
             **kwargs)
 
+def _check_foldable(layer_conv, layer_norm, channels=None):
+    '''
+    Check whether the batch normalization could be folded into the
+    convolution whose outputs are normalized. Only the plain and group
+    convolutions are accepted, and the normalization should be applied
+    along the channel axis only.
+    Arguments:
+        layer_conv: the convolutional layer (built).
+        layer_norm: the following normalization layer (built).
+        channels:   the number of normalized channels. If not set, use the
+                    output channel number of the convolution.
+    '''
+    if type(layer_conv) not in (Conv, _GroupConv) or (not isinstance(layer_norm, BatchNormalization)):
+        return False
+    if not (layer_conv.built and layer_norm.built):
+        return False
+    if getattr(layer_norm, 'renorm', False) or getattr(layer_norm, 'virtual_batch_size', None) is not None:
+        return False
+    if getattr(layer_norm, 'adjustment', None) is not None:
+        return False
+    axis = layer_norm.axis
+    if isinstance(axis, (list, tuple)):
+        if len(axis) != 1:
+            return False
+        axis = axis[0]
+    ndim = layer_conv.rank + 2
+    channel_axis = 1 if layer_conv.data_format == 'channels_first' else ndim - 1
+    if axis % ndim != channel_axis:
+        return False
+    if channels is None:
+        channels = int(layer_conv.kernel.shape[-1])
+    return int(layer_norm.moving_mean.shape[0]) == channels
+
+def _fold_batch_norm(layer_conv, layer_norm, channels=None, bias_initializer='zeros', bias_regularizer=None, bias_constraint=None):
+    '''
+    Fold the inference-time batch normalization into the convolution:
+        `gamma * ( conv(x, W) + b - mean ) / sqrt(var + eps) + beta`
+        `= conv(x, s * W) + s * (b - mean) + beta, s = gamma / sqrt(var + eps)`
+    The kernel is rescaled along the output channels. If the convolution
+    does not have a bias, it would be created.
+    Arguments:
+        layer_conv: the convolutional layer (checked by `_check_foldable`).
+        layer_norm: the following batch normalization layer.
+        channels:   a slice selecting the normalization channels corresp-
+                    onding to the convolution outputs (used when several
+                    convolutions are concatenated). If not set, use all
+                    channels.
+        bias_initializer, bias_regularizer, bias_constraint: the config-
+                    urations for creating the bias.
+    '''
+    if channels is None:
+        channels = slice(None)
+    kernel, mean, var = K.batch_get_value([layer_conv.kernel, layer_norm.moving_mean, layer_norm.moving_variance])
+    scale = 1.0 / np.sqrt(var[channels] + layer_norm.epsilon)
+    if layer_norm.scale:
+        scale = scale * K.get_value(layer_norm.gamma)[channels]
+    if layer_conv.use_bias:
+        bias = K.get_value(layer_conv.bias)
+    else:
+        bias = 0.0
+    bias = scale * (bias - mean[channels])
+    if layer_norm.center:
+        bias = bias + K.get_value(layer_norm.beta)[channels]
+    if not layer_conv.use_bias:
+        layer_conv.bias_initializer = initializers.get(bias_initializer)
+        layer_conv.bias_regularizer = regularizers.get(bias_regularizer)
+        layer_conv.bias_constraint = constraints.get(bias_constraint)
+        layer_conv.bias = layer_conv.add_weight(
+            name='bias',
+            shape=(kernel.shape[-1],),
+            initializer=layer_conv.bias_initializer,
+            regularizer=layer_conv.bias_regularizer,
+            constraint=layer_conv.bias_constraint,
+            trainable=True,
+            dtype=layer_conv.dtype)
+        layer_conv.use_bias = True
+    K.batch_set_value([(layer_conv.kernel, (kernel * scale).astype(kernel.dtype)),
+                       (layer_conv.bias, bias.astype(kernel.dtype))])
+
 class _AConv(Layer):
     """Modern convolutional layer.
     Abstract nD convolution layer (private, used as implementation base).
@@ -1449,6 +1590,32 @@ class _AConv(Layer):
             next_shape = self.layer_actv.compute_output_shape(next_shape)
         return next_shape
 
+    def fold_normalization(self):
+        '''
+        Fold the batch normalization into the convolutional kernel and bias
+        for inference. After folding, this layer is equivalent to the one
+        using the `bias` normalization, and the moving statistics would not
+        be used anymore. So the folded layer should be only used for infer-
+        ence.
+        Returns:
+            The number of the folded normalization layers (0 or 1).
+        '''
+        if not (self.built and self.normalization and (not self.use_bias)):
+            return 0
+        if not _check_foldable(self.layer_conv, self.layer_norm):
+            return 0
+        _fold_batch_norm(self.layer_conv, self.layer_norm,
+                         bias_initializer=self.beta_initializer,
+                         bias_regularizer=self.beta_regularizer,
+                         bias_constraint=self.beta_constraint)
+        del self.layer_norm
+        self.normalization = 'bias'
+        self.use_bias = True
+        self.gamma_initializer = None
+        self.gamma_regularizer = None
+        self.gamma_constraint = None
+        return 1
+
     def get_config(self):
         config = {
             'filters': self.filters,
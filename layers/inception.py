@@ -30,6 +30,10 @@
 # ture of such a scheme is as
 #   Input + "Inception-v4 plain block"
 # We have also implemented the InceptRes-v4 in this module.
+# Version: 0.49 # 2026/10/19
+# Comments:
+#   Enable the blocks to fold the batch normalization layers for
+#   inference.
 # Version: 0.48 # 2019/6/27
 # Comments:
 #   Switch back to the version where projection layers have
@@ -528,6 +532,30 @@ class _Inception(Layer):
         next_shape = self.layer_merge.compute_output_shape([branch_zero_shape, branch_one_shape, *branch_middle_shape_list])
         return next_shape
     
+    def fold_normalization(self):
+        '''
+        Fold the batch normalization layers for inference. In each branch,
+        the normalization of each unit (except the first one) is folded into
+        the convolution of the previous unit, and the AConv branches are
+        folded by themselves.
+        The folded block should be only used for inference.
+        Returns:
+            The number of the folded normalization layers.
+        '''
+        if not self.built:
+            return 0
+        n_folded = 0
+        for layer in (self.layer_branch_zero_map, self.layer_branch_one):
+            if layer is not None:
+                n_folded += layer.fold_normalization()
+        for D in range(self.depth-1):
+            layer_prev = getattr(self, 'layer_middle_D{0:02d}_00'.format(D+2))
+            for i in range(D+1):
+                layer_middle = getattr(self, 'layer_middle_D{0:02d}_{1:02d}'.format(D+2, i+1))
+                n_folded += layer_middle.fold_normalization(layer_prev)
+                layer_prev = layer_middle
+        return n_folded
+
     def get_config(self):
         config = {
             'depth': self.depth,
@@ -1574,6 +1602,30 @@ class _InceptionTranspose(Layer):
             next_shape = self.layer_cropping.compute_output_shape(next_shape)
         return next_shape
     
+    def fold_normalization(self):
+        '''
+        Fold the batch normalization layers for inference. In each branch,
+        the normalization of each unit (except the first one) is folded into
+        the convolution of the previous unit, and the AConv branches are
+        folded by themselves.
+        The folded block should be only used for inference.
+        Returns:
+            The number of the folded normalization layers.
+        '''
+        if not self.built:
+            return 0
+        n_folded = 0
+        for layer in (self.layer_branch_zero_map, self.layer_branch_one):
+            if layer is not None:
+                n_folded += layer.fold_normalization()
+        for D in range(self.depth-1):
+            layer_prev = getattr(self, 'layer_middle_D{0:02d}_00'.format(D+2))
+            for i in range(D+1):
+                layer_middle = getattr(self, 'layer_middle_D{0:02d}_{1:02d}'.format(D+2, i+1))
+                n_folded += layer_middle.fold_normalization(layer_prev)
+                layer_prev = layer_middle
+        return n_folded
+
     def get_config(self):
         config = {
             'depth': self.depth,
@@ -2627,6 +2679,32 @@ class _Inceptres(Layer):
         next_shape = self.layer_merge.compute_output_shape([branch_left_shape, branch_right_shape])
         return next_shape
     
+    def fold_normalization(self):
+        '''
+        Fold the batch normalization layers for inference. In each branch,
+        the normalization of each unit (except the first one) is folded into
+        the convolution of the previous unit, and the AConv branches are
+        folded by themselves.
+        The folded block should be only used for inference.
+        Returns:
+            The number of the folded normalization layers.
+        '''
+        if not self.built:
+            return 0
+        n_folded = 0
+        if self.layer_branch_left is not None:
+            n_folded += self.layer_branch_left.fold_normalization()
+        for layer in (self.layer_branch_zero_map, self.layer_branch_one):
+            if layer is not None:
+                n_folded += layer.fold_normalization()
+        for D in range(self.depth-1):
+            layer_prev = getattr(self, 'layer_middle_D{0:02d}_00'.format(D+2))
+            for i in range(D+1):
+                layer_middle = getattr(self, 'layer_middle_D{0:02d}_{1:02d}'.format(D+2, i+1))
+                n_folded += layer_middle.fold_normalization(layer_prev)
+                layer_prev = layer_middle
+        return n_folded
+
     def get_config(self):
         config = {
             'depth': self.depth,
@@ -3727,6 +3805,32 @@ class _InceptresTranspose(Layer):
             next_shape = self.layer_cropping.compute_output_shape(next_shape)
         return next_shape
     
+    def fold_normalization(self):
+        '''
+        Fold the batch normalization layers for inference. In each branch,
+        the normalization of each unit (except the first one) is folded into
+        the convolution of the previous unit, and the AConv branches are
+        folded by themselves.
+        The folded block should be only used for inference.
+        Returns:
+            The number of the folded normalization layers.
+        '''
+        if not self.built:
+            return 0
+        n_folded = 0
+        if self.layer_branch_left is not None:
+            n_folded += self.layer_branch_left.fold_normalization()
+        for layer in (self.layer_branch_zero_map, self.layer_branch_one):
+            if layer is not None:
+                n_folded += layer.fold_normalization()
+        for D in range(self.depth-1):
+            layer_prev = getattr(self, 'layer_middle_D{0:02d}_00'.format(D+2))
+            for i in range(D+1):
+                layer_middle = getattr(self, 'layer_middle_D{0:02d}_{1:02d}'.format(D+2, i+1))
+                n_folded += layer_middle.fold_normalization(layer_prev)
+                layer_prev = layer_middle
+        return n_folded
+
     def get_config(self):
         config = {
             'depth': self.depth,
@@ -4710,6 +4814,33 @@ class _Inceptplus(Layer):
         next_shape = self.layer_merge.compute_output_shape([branch_left_shape, branch_right_shape])
         return next_shape
     
+    def fold_normalization(self):
+        '''
+        Fold the batch normalization layers for inference. In each branch,
+        the normalization of each unit (except the first one) is folded into
+        the convolution of the previous unit, and the AConv branches are
+        folded by themselves. The normalization of the output mapping
+        is folded into the last convolutions of the concatenated branches.
+        The folded block should be only used for inference.
+        Returns:
+            The number of the folded normalization layers.
+        '''
+        if not self.built:
+            return 0
+        n_folded = 0
+        if self.layer_branch_left is not None:
+            n_folded += self.layer_branch_left.fold_normalization()
+        layer_last_list = []
+        for D in range(self.depth):
+            layer_prev = getattr(self, 'layer_middle_D{0:02d}_00'.format(D+1))
+            for i in range(D+1):
+                layer_middle = getattr(self, 'layer_middle_D{0:02d}_{1:02d}'.format(D+1, i+1))
+                n_folded += layer_middle.fold_normalization(layer_prev)
+                layer_prev = layer_middle
+            layer_last_list.append(layer_prev)
+        n_folded += self.layer_branch_right_map.fold_normalization(*layer_last_list)
+        return n_folded
+
     def get_config(self):
         config = {
             'depth': self.depth,
@@ -5751,6 +5882,33 @@ class _InceptplusTranspose(Layer):
             next_shape = self.layer_cropping.compute_output_shape(next_shape)
         return next_shape
     
+    def fold_normalization(self):
+        '''
+        Fold the batch normalization layers for inference. In each branch,
+        the normalization of each unit (except the first one) is folded into
+        the convolution of the previous unit, and the AConv branches are
+        folded by themselves. The normalization of the output mapping
+        is folded into the last convolutions of the concatenated branches.
+        The folded block should be only used for inference.
+        Returns:
+            The number of the folded normalization layers.
+        '''
+        if not self.built:
+            return 0
+        n_folded = 0
+        if self.layer_branch_left is not None:
+            n_folded += self.layer_branch_left.fold_normalization()
+        layer_last_list = []
+        for D in range(self.depth):
+            layer_prev = getattr(self, 'layer_middle_D{0:02d}_00'.format(D+1))
+            for i in range(D+1):
+                layer_middle = getattr(self, 'layer_middle_D{0:02d}_{1:02d}'.format(D+1, i+1))
+                n_folded += layer_middle.fold_normalization(layer_prev)
+                layer_prev = layer_middle
+            layer_last_list.append(layer_prev)
+        n_folded += self.layer_branch_right_map.fold_normalization(*layer_last_list)
+        return n_folded
+
     def get_config(self):
         config = {
             'depth': self.depth,
@@ -49,6 +49,10 @@
 #   https://arxiv.org/abs/1611.05431
 #
 # layers has been modified according to the residual-v2 theory.
+# Version: 0.43 # 2026/10/19
+# Comments:
+#   Enable the blocks to fold the batch normalization layers for
+#   inference.
 # Version: 0.42 # 2019/6/27
 # Comments:
 #   Switch back to the version where projection layers have
@@ -473,6 +477,28 @@ class _Residual(Layer):
         next_shape = self.layer_merge.compute_output_shape([branch_left_shape, branch_right_shape])
         return next_shape
     
+    def fold_normalization(self):
+        '''
+        Fold the batch normalization layers for inference. The normalization
+        of each unit (except the first one) is folded into the convolution of
+        the previous unit, and the projection branch is folded like AConv.
+        The folded block should be only used for inference.
+        Returns:
+            The number of the folded normalization layers.
+        '''
+        if not self.built:
+            return 0
+        n_folded = 0
+        if self.layer_branch_left is not None:
+            n_folded += self.layer_branch_left.fold_normalization()
+        layer_prev = self.layer_first
+        for i in range(self.depth):
+            layer_middle = getattr(self, 'layer_middle_{0:02d}'.format(i))
+            n_folded += layer_middle.fold_normalization(layer_prev)
+            layer_prev = layer_middle
+        n_folded += self.layer_last.fold_normalization(layer_prev)
+        return n_folded
+
     def get_config(self):
         config = {
             'depth': self.depth + 2,
@@ -1427,6 +1453,28 @@ class _ResidualTranspose(Layer):
             next_shape = self.layer_cropping.compute_output_shape(next_shape)
         return next_shape
     
+    def fold_normalization(self):
+        '''
+        Fold the batch normalization layers for inference. The normalization
+        of each unit (except the first one) is folded into the convolution of
+        the previous unit, and the projection branch is folded like AConv.
+        The folded block should be only used for inference.
+        Returns:
+            The number of the folded normalization layers.
+        '''
+        if not self.built:
+            return 0
+        n_folded = 0
+        if self.layer_branch_left is not None:
+            n_folded += self.layer_branch_left.fold_normalization()
+        layer_prev = self.layer_first
+        for i in range(self.depth):
+            layer_middle = getattr(self, 'layer_middle_{0:02d}'.format(i))
+            n_folded += layer_middle.fold_normalization(layer_prev)
+            layer_prev = layer_middle
+        n_folded += self.layer_last.fold_normalization(layer_prev)
+        return n_folded
+
     def get_config(self):
         config = {
             'depth': self.depth + 2,
@@ -2371,6 +2419,28 @@ class _Resnext(Layer):
         next_shape = self.layer_merge.compute_output_shape([branch_left_shape, branch_right_shape])
         return next_shape
     
+    def fold_normalization(self):
+        '''
+        Fold the batch normalization layers for inference. The normalization
+        of each unit (except the first one) is folded into the convolution of
+        the previous unit, and the projection branch is folded like AConv.
+        The folded block should be only used for inference.
+        Returns:
+            The number of the folded normalization layers.
+        '''
+        if not self.built:
+            return 0
+        n_folded = 0
+        if self.layer_branch_left is not None:
+            n_folded += self.layer_branch_left.fold_normalization()
+        layer_prev = self.layer_first
+        for i in range(self.depth):
+            layer_middle = getattr(self, 'layer_middle_{0:02d}'.format(i+1))
+            n_folded += layer_middle.fold_normalization(layer_prev)
+            layer_prev = layer_middle
+        n_folded += self.layer_last.fold_normalization(layer_prev)
+        return n_folded
+
     def get_config(self):
         config = {
             'depth': self.depth + 2,
@@ -3351,6 +3421,28 @@ class _ResnextTranspose(Layer):
             next_shape = self.layer_cropping.compute_output_shape(next_shape)
         return next_shape
     
+    def fold_normalization(self):
+        '''
+        Fold the batch normalization layers for inference. The normalization
+        of each unit (except the first one) is folded into the convolution of
+        the previous unit, and the projection branch is folded like AConv.
+        The folded block should be only used for inference.
+        Returns:
+            The number of the folded normalization layers.
+        '''
+        if not self.built:
+            return 0
+        n_folded = 0
+        if self.layer_branch_left is not None:
+            n_folded += self.layer_branch_left.fold_normalization()
+        layer_prev = self.layer_first
+        for i in range(self.depth):
+            layer_middle = getattr(self, 'layer_middle_{0:02d}'.format(i+1))
+            n_folded += layer_middle.fold_normalization(layer_prev)
+            layer_prev = layer_middle
+        n_folded += self.layer_last.fold_normalization(layer_prev)
+        return n_folded
+
     def get_config(self):
         config = {
             'depth': self.depth + 2,
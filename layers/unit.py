@@ -21,6 +21,10 @@
 # The norm-actv-conv structure is proved to be effective by 
 # this paper:
 #   https://arxiv.org/abs/1603.05027
+# Version: 0.22 # 2026/10/19
+# Comments:
+#   Enable NACUnit to fold its batch normalization into the con-
+#   volution of the previous units for inference.
 # Version: 0.21 # 2019/6/20
 # Comments:
 #   Fix a bug for using bias when using group convlution in
@@ -53,7 +57,7 @@ from tensorflow.python.ops import array_ops
 from tensorflow.keras.layers import BatchNormalization, LeakyReLU, PReLU
 from tensorflow.python.keras.layers.convolutional import Conv, Conv2DTranspose, Conv3DTranspose, UpSampling1D, UpSampling2D, UpSampling3D, ZeroPadding1D, ZeroPadding2D, ZeroPadding3D, Cropping1D, Cropping2D, Cropping3D
 from .normalize import InstanceNormalization, GroupNormalization
-from .conv import _GroupConv, _get_macro_conv
+from .conv import _GroupConv, _get_macro_conv, _check_foldable, _fold_batch_norm
 
 from .. import compat
 if compat.COMPATIBLE_MODE['1.12']:
@@ -354,6 +358,50 @@ class NACUnit(Layer):
             next_shape = self.layer_actv.compute_output_shape(next_shape)
         next_shape = self.layer_conv.compute_output_shape(next_shape)
         return next_shape
+
+    def fold_normalization(self, *units):
+        '''
+        Fold the batch normalization of this unit into the convolutions of
+        the previous units for inference. The outputs of the previous units
+        should be only used as the input of this unit. If there are more than
+        one previous units, their outputs should be concatenated along the
+        channel axis in the given order.
+        After folding, this unit does not have the normalization, and the
+        previous units would use the biases. The folded units should be only
+        used for inference.
+        Arguments:
+            units: the previous NACUnits whose outputs are the input of this
+                   unit.
+        Returns:
+            The number of the folded normalization layers (0 or 1).
+        '''
+        if not (self.built and self.normalization and (not self.use_bias)):
+            return 0
+        if not units:
+            return 0
+        for unit in units:
+            if not (isinstance(unit, NACUnit) and unit.built):
+                return 0
+        channels = [int(unit.layer_conv.kernel.shape[-1]) for unit in units]
+        for unit in units:
+            if not _check_foldable(unit.layer_conv, self.layer_norm, channels=sum(channels)):
+                return 0
+        offset = 0
+        for unit, n_chn in zip(units, channels):
+            _fold_batch_norm(unit.layer_conv, self.layer_norm,
+                             channels=slice(offset, offset + n_chn),
+                             bias_initializer=unit.beta_initializer,
+                             bias_regularizer=unit.beta_regularizer,
+                             bias_constraint=unit.beta_constraint)
+            unit._use_bias = True
+            offset += n_chn
+        del self.layer_norm
+        self.normalization = 'bias'
+        self.use_bias = True
+        self.gamma_initializer = None
+        self.gamma_regularizer = None
+        self.gamma_constraint = None
+        return 1
     
     def get_config(self):
         config = {
@@ -12,6 +12,9 @@
 # For example, it has callbacks for fitting a network, the pre-
 # processing and postprocessing tools and APIs for drawing
 # figures. 
+# Version: 0.32 # 2026/10/19
+# Comments:
+#   Add the tool: fold_normalization.
 # Version: 0.30 # 2019/11/27
 # Comments:
 #   Finish the submodule: tboard.
@@ -26,11 +29,11 @@
 
 # Import sub-modules
 from . import callbacks, draw, tboard
-from ._default import save_model, load_model
+from ._default import save_model, load_model, fold_normalization
 
 __all__ = [
             'callbacks', 'draw', 'tboard',
-            'save_model', 'load_model'
+            'save_model', 'load_model', 'fold_normalization'
           ]
 
 # Set this local module as the prefered one
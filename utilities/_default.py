@@ -10,6 +10,10 @@
 # The default tools would be imported directly into the current
 # sub-module. It could be viewed as an extension of basic APIs
 # in this category.
+# Version: 0.40 # 2026/10/19
+# Comments:
+#   Add fold_normalization for folding the batch normalization
+#   layers of MDNT layers into the convolutions for inference.
 # Version: 0.35 # 2019/11/27
 # Comments:
 #   1. Fix a bug for checking the existence of the file when
@@ -48,9 +52,10 @@ from six.moves import zip  # pylint: disable=redefined-builtin
 
 from tensorflow.python.ops import variables
 from tensorflow.python.keras import backend as K
+from tensorflow.python.keras import models
 from tensorflow.python.keras import optimizers
 from tensorflow.python.keras.utils.io_utils import ask_to_proceed_with_overwrite
-from tensorflow.python.keras.utils.generic_utils import deserialize_keras_object
+from tensorflow.python.keras.utils.generic_utils import deserialize_keras_object, CustomObjectScope
 from tensorflow.python.keras.engine.saving import model_from_config, preprocess_weights_for_loading
 from tensorflow.python.platform import tf_logging as logging
 from tensorflow.python.util import serialization
@@ -505,6 +510,56 @@ def load_model(filepath, headpath=None, optmpath=None, custom_objects=None, comp
                 fo.close()
     return model
 
+def _fold_layers(layers):
+    """Fold the normalization layers of a list of layers in place.
+    The nested models would be searched recursively.
+    Returns:
+        The number of the folded normalization layers.
+    """
+    n_folded = 0
+    for layer in layers:
+        if hasattr(layer, 'fold_normalization'):
+            n_folded += layer.fold_normalization()
+        elif hasattr(layer, 'layers'):
+            n_folded += _fold_layers(layer.layers)
+    return n_folded
+
+def fold_normalization(model, custom_objects=None):
+    """Fold the batch normalization layers into the convolutions for inference.
+    At inference, the batch normalization is an affine transform with the
+    moving statistics, so it could be merged into the kernel and bias of the
+    adjacent convolution. This function would fold:
+        1. The normalization of AConv (Conv -> Norm -> Actv) into its own
+           convolution.
+        2. The normalization of each Norm -> Actv -> Conv unit inside the
+           residual and inception blocks into the convolution of the previous
+           unit (if the input of the unit is only the output of the previous
+           units).
+    Other layers are kept unchanged. The input model is copied before folding,
+    and the returned model is built by the folded layers, so it could be used
+    for inference directly. Note that the configurations of the residual and
+    inception blocks could not record the folded units, so the folded model
+    should not be saved. Save the original model instead, and fold it again
+    after loading.
+    Arguments:
+        model: The model to be folded. It should be a functional or Sequential
+            model. This model would not be changed.
+        custom_objects: Optional dictionary mapping names (strings) to custom
+            classes or functions to be considered during copying the model.
+            The MDNT objects are included by default.
+    Returns:
+        The folded model (not compiled).
+    """
+    objects = dict(custom_objects or {}) # Do not modify the dict of the caller.
+    objects.update(customObjects)
+    with CustomObjectScope(objects):
+        model_fold = models.clone_model(model)
+    model_fold.set_weights(model.get_weights())
+    n_folded = _fold_layers(model_fold.layers)
+    logging.info('Fold {0} batch normalization layers.'.format(n_folded))
+    # Rebuild the graph by the folded layers.
+    return models.clone_model(model_fold, clone_function=lambda layer: layer)
+
 def save_weights_to_hdf5_group(f, fh_dict, layers, compress=False):
     """Saves the weights of a list of layers to a HDF5 group.
     This is revised version. We split the attributes of HDF5 group into another